@@ -0,0 +1,224 @@
+# Test_database.py
+# Vérifie que les requêtes fréquentes utilisent un index (pas de parcours complet de table).
+# Lancer avec : python Test_database.py
+import os
+import tempfile
+
+from sqlalchemy import text
+
+# Base temporaire : ne jamais toucher database/mispa.db
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_mispa.db')}"
+os.environ.setdefault('TRANSLATION_BACKENDS', 'stub')
+
+from datetime import datetime
+import message_search
+import user_search
+from app import (app, db, User, Contact, Group, GroupMember, Invitation, Message, Conversation,
+                 FILE_MESSAGE_TYPES, conversation_direction, unread_messages, user_conversations,
+                 direction_messages_after, undelivered_messages, directory_query)
+
+
+def explain(query):
+    """Retourne le plan d'exécution (EXPLAIN QUERY PLAN) d'une requête SQLAlchemy"""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        params.append(value.isoformat(' ') if isinstance(value, datetime) else value)
+
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), tuple(params)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def assert_uses_index(name, query, table='message', ordered=False):
+    """
+    Échoue si le plan parcourt toute la table (ou tout un index) au lieu de chercher.
+    ordered : requête paginée, dont l'ordre doit venir de l'index ; un tri dans
+    un B-tree temporaire trierait toutes les lignes correspondantes à chaque page.
+    """
+    plan = explain(query)
+    scans = [line for line in plan if line.startswith(f'SCAN {table}')]
+    assert not scans, f"❌ {name}: parcours complet de la table {table} -> {plan}"
+    sorts = [line for line in plan if line.startswith('USE TEMP B-TREE')]
+    assert not (ordered and sorts), f"❌ {name}: tri temporaire au lieu de l'ordre de l'index -> {plan}"
+    print(f"✅ {name}: {' | '.join(plan)}")
+
+
+with app.app_context():
+    db.create_all()
+    cursor = (datetime(2024, 1, 1), 100)
+
+    # Historique d'une conversation (get_messages) : chaque sens, lu dans l'ordre de l'index
+    assert_uses_index('get_messages (page récente)', conversation_direction(1, 2).limit(51),
+                      ordered=True)
+    assert_uses_index('get_messages (before)', conversation_direction(1, 2, before=cursor).limit(51),
+                      ordered=True)
+    assert_uses_index('get_messages (after)', conversation_direction(2, 1, after=cursor).limit(51),
+                      ordered=True)
+
+    # Messages non lus (mark_as_read, read_message)
+    assert_uses_index('non lus après le filigrane', unread_messages(1, 2, 10).with_entities(db.func.count(Message.id)))
+
+    # Rattrapage après reconnexion (/api/sync)
+    assert_uses_index('sync (messages après le curseur)', direction_messages_after(1, 2, 10).limit(201),
+                      ordered=True)
+
+    # File de distribution à la connexion (index partiel)
+    assert_uses_index('messages non distribués', undelivered_messages(1, 10).limit(101), ordered=True)
+
+    # Recherche d'utilisateurs par préfixe (/api/search_users)
+    for column in ('name', 'email_local'):
+        assert_uses_index(
+            f'search_users (préfixe, {column})',
+            text(user_search.PREFIX.format(column=column)).bindparams(low='el', high='em', limit=21),
+            table='user_search'
+        )
+    assert_uses_index('search_users (domaine)',
+                      text(user_search.PREFIX.format(column='email_domain')).bindparams(low='co', high='cp', limit=21),
+                      table='user_search')
+    assert_uses_index('search_users (adresse)',
+                      user_search.ADDRESS.bindparams(local='jean', low='co', high='cp', limit=21),
+                      table='user_search')
+
+    # Annuaire paginé par clé (/api/users) : la page suivante reprend par une recherche dans l'index
+    for sort, after in (('username', ['m']), ('username_desc', ['m']), ('language', ['fr', 'm']),
+                        ('recent', [datetime(2024, 1, 1), 100]), ('oldest', [datetime(2024, 1, 1), 100])):
+        assert_uses_index(f'annuaire ({sort}, page suivante)', directory_query(1, sort, after=after).limit(31),
+                          table='user', ordered=True)
+    # Utilisateurs sans date de connexion ou sans langue : en fin d'annuaire, toujours dans l'ordre d'un index
+    for sort, after in (('recent', [None, 100]), ('oldest', [None, 100]), ('language', [None, 'm'])):
+        assert_uses_index(f'annuaire ({sort}, clés NULL)', directory_query(1, sort, after=after).limit(31),
+                          table='user', ordered=True)
+
+    # Statistiques de fichiers (get_file_stats)
+    assert_uses_index(
+        'get_file_stats (envoyés)',
+        Message.query.filter(
+            Message.sender_id == 1,
+            Message.message_type.in_(FILE_MESSAGE_TYPES)
+        ).with_entities(db.func.count(Message.id))
+    )
+    assert_uses_index(
+        'get_file_stats (reçus)',
+        Message.query.filter(
+            Message.receiver_id == 1,
+            Message.message_type.in_(FILE_MESSAGE_TYPES)
+        ).with_entities(db.func.count(Message.id))
+    )
+    assert_uses_index(
+        'get_file_stats (taille totale)',
+        db.session.query(db.func.sum(Message.file_size)).filter(
+            Message.sender_id == 1,
+            Message.file_size.isnot(None)
+        )
+    )
+
+    # Résumés de conversation (barre latérale, badges, statistiques)
+    assert_uses_index('chat (conversations)', user_conversations(1), table='conversation')
+    assert_uses_index(
+        'get_chat_stats',
+        user_conversations(1).with_entities(
+            db.func.sum(Conversation.message_count),
+            db.func.max(Conversation.last_message_at)
+        ),
+        table='conversation'
+    )
+
+print("🎉 Toutes les requêtes fréquentes utilisent un index")
+
+
+# Nombre de requêtes SQL par page : constant quelle que soit la taille du réseau
+app.config['SQL_QUERY_COUNT_HEADER'] = True
+
+
+def create_social_graph(owner, size):
+    """Crée `size` contacts, groupes et invitations pour l'utilisateur owner"""
+    with app.app_context():
+        for i in range(size):
+            friend = User(username=f'{owner}_ami{i}', email=f'{owner}_ami{i}@test.com', password_hash='x')
+            db.session.add(friend)
+            db.session.flush()
+            db.session.add(Contact(user_id=users[owner], contact_id=friend.id))
+            group = Group(name=f'{owner}_groupe{i}', created_by=users[owner])
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=users[owner]))
+            db.session.add(GroupMember(group_id=group.id, user_id=friend.id))
+            db.session.add(Invitation(sender_id=users[owner], recipient_email=f'{owner}_ami{i}@test.com'))
+        db.session.commit()
+
+
+def query_count(user_id, url):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    response = client.get(url)
+    assert response.status_code == 200, f"❌ {url}: statut {response.status_code}"
+    return int(response.headers['X-Query-Count'])
+
+
+with app.app_context():
+    users = {}
+    for name in ('petit', 'grand'):
+        user = User(username=name, email=f'{name}@test.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        users[name] = user.id
+
+create_social_graph('petit', 2)
+create_social_graph('grand', 25)
+
+for url in ('/chat', '/contacts'):
+    query_count(users['petit'], url)  # remplit les caches du processus (nombre d'inscrits)
+    small, large = query_count(users['petit'], url), query_count(users['grand'], url)
+    assert small == large, f"❌ {url}: {small} requêtes avec 2 contacts, {large} avec 25 (N+1)"
+    print(f"✅ {url}: {large} requêtes SQL, quel que soit le nombre de contacts")
+
+print("🎉 Les pages ne font plus de requêtes N+1")
+
+
+# Accusé de réception d'un message direct : le client accuse data.message_id (voir chat.html)
+from app import socketio
+
+
+def socket_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    return client, socketio.test_client(app, flask_test_client=client)
+
+
+sender, _ = socket_client(users['petit'])
+_, receiver_socket = socket_client(users['grand'])
+receiver_socket.get_received()
+
+response = sender.post('/send_message_direct', json={'receiver_id': users['grand'], 'content': 'bonjour'})
+assert response.status_code == 200, f"❌ send_message_direct: statut {response.status_code}"
+message_id = response.get_json()['message_id']
+
+events = [event['args'][0] for event in receiver_socket.get_received() if event['name'] == 'direct_message']
+assert events and events[0].get('message_id') == message_id, f"❌ direct_message sans message_id: {events}"
+receiver_socket.emit('messages_delivered', {'message_ids': [events[0]['message_id']]})
+
+with app.app_context():
+    assert db.session.get(Message, message_id).is_delivered, "❌ message direct non marqué distribué après l'accusé"
+print("✅ direct_message: accusé de réception pris en compte")
+
+
+# Recherche plein texte : le dernier mot est cherché en préfixe tel quel, sans être tronqué
+with app.app_context():
+    with db.engine.begin() as connection:
+        message_search.install(connection)
+        message_search.rebuild(connection)
+    for content in ('bonjour à tous', 'une boite aux lettres'):
+        db.session.add(Message(sender_id=users['petit'], receiver_id=users['grand'], content=content,
+                               timestamp=datetime.utcnow()))
+    db.session.commit()
+    for query in ('bon', 'bonj', 'bonjo'):
+        with db.engine.connect() as connection:
+            results, _ = message_search.search(connection, users['petit'], query)
+        found = [result['snippet'] for result in results]
+        assert found and all('bonjour' in snippet for snippet in found), f"❌ recherche '{query}': {found}"
+print("✅ recherche 'bon', 'bonj', 'bonjo': trouvent 'bonjour', pas 'boite'")
@@ -1,27 +1,43 @@
+import heapq
 import math
 import os
 import json
 import re
 import random
 import time
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file, g, has_request_context
+from markupsafe import escape
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm.attributes import set_committed_value
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_socketio import SocketIO, emit, join_room
 import eventlet
+from eventlet import tpool
 from werkzeug.utils import secure_filename
 from config import Config
-from translate_service import translation_service
+from translate_service import translation_service, classify_text
 from security import security_manager
+import sqlite_tuning
+import message_search
+import user_search
+from write_behind import GroupCommitWriter
+from presence import PresenceRegistry
+from contact_graph import ContactGraph
+from event_throttle import EventCoalescer, RelayLimiter
 
 # Configuration de l'application
-app = Flask(__name__)
+app = Flask(__name__, template_folder='Templates')
 app.config.from_object(Config)
 socketio = SocketIO(app, async_mode='eventlet', cors_allowed_origins="*")
 
 # Initialisation de la base de données
-db = SQLAlchemy(app)
+sqlite_tuning.configure(app)
+db = SQLAlchemy(app, session_options={'class_': sqlite_tuning.RoutingSession})
+sqlite_tuning.install(app, db)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -39,6 +55,44 @@ app.config['ALLOWED_EXTENSIONS'] = {
     'code': {'py', 'js', 'html', 'css', 'java', 'cpp', 'c'}
 }
 
+# Traduction par lot
+app.config['MAX_BATCH_TRANSLATIONS'] = 200
+
+# Pagination de l'historique des conversations
+app.config['MESSAGES_PAGE_SIZE'] = 50
+app.config['MESSAGES_MAX_PAGE_SIZE'] = 200
+app.config['MESSAGE_PREVIEW_LENGTH'] = 100
+
+# Rattrapage après reconnexion (/api/sync) : messages par réponse, et recouvrement
+# du curseur (secondes) pour ne pas manquer les écritures validées pendant la synchro
+app.config['SYNC_MAX_MESSAGES'] = 200
+app.config['SYNC_OVERLAP_SECONDS'] = 5
+
+# Messages non distribués envoyés par trame à la connexion (un accusé par trame)
+app.config['DELIVERY_BATCH_SIZE'] = 100
+
+# Recherche dans l'historique (/api/search_messages) : résultats par page
+app.config['SEARCH_PAGE_SIZE'] = 20
+
+# Annuaire des utilisateurs (onglet Explorer de /contacts) : utilisateurs par page
+# (taille par défaut et maximale demandable), et durée (secondes) pendant laquelle
+# le nombre d'inscrits affiché est réutilisé
+app.config['DIRECTORY_PAGE_SIZE'] = 30
+app.config['DIRECTORY_MAX_PAGE_SIZE'] = 100
+app.config['DIRECTORY_COUNT_TTL'] = 60
+
+# Présence en mémoire, écrite dans la table user toutes les N secondes
+app.config['PRESENCE_FLUSH_INTERVAL'] = 30
+
+# Événements éphémères (saisie, progression) : au plus un par intervalle (secondes)
+# et par destinataire, et un seau à jetons par connexion (événements/seconde, rafale)
+app.config['SOCKET_EVENT_INTERVAL'] = 0.25
+app.config['SOCKET_RELAY_RATE'] = 10
+app.config['SOCKET_RELAY_BURST'] = 20
+
+# Traduction asynchrone des messages (nombre de traductions simultanées)
+app.config['TRANSLATION_WORKERS'] = 8
+
 # Langues supportées
 app.config['SUPPORTED_LANGUAGES'] = {
     'fr': 'Français',
@@ -71,6 +125,23 @@ os.makedirs(os.path.join('static', 'avatars'), exist_ok=True)
 os.makedirs(os.path.join('static', 'voice_messages'), exist_ok=True)
 os.makedirs('database', exist_ok=True)
 
+# =============== COMPTEUR DE REQUÊTES SQL ===============
+
+# Renvoie le nombre de requêtes SQL de chaque réponse dans l'en-tête X-Query-Count
+# (utilisé par Test_database.py pour vérifier que les pages restent en O(1) requêtes)
+app.config['SQL_QUERY_COUNT_HEADER'] = False
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_sql_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+@app.after_request
+def add_query_count_header(response):
+    if app.config['SQL_QUERY_COUNT_HEADER']:
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+    return response
+
 # =============== MODÈLES DE DONNÉES ===============
 
 class User(UserMixin, db.Model):
@@ -98,6 +169,31 @@ class User(UserMixin, db.Model):
     messages_received = db.relationship('Message', foreign_keys='Message.receiver_id', backref='receiver', lazy=True)
     sent_invitations = db.relationship('Invitation', foreign_keys='Invitation.sender_id', backref='sender', lazy=True)
 
+    __table_args__ = (
+        # Annuaire paginé par clé (directory_page) : un index par ordre de tri
+        db.Index('ix_user_language_username', 'language', 'username'),
+        db.Index('ix_user_last_seen', 'last_seen'),
+    )
+
+class UserSearch(db.Model):
+    """
+    Index de recherche des utilisateurs (voir user_search.py) : nom, partie
+    locale et domaine de l'email normalisés (minuscules, sans accents), une ligne par
+    utilisateur (id = User.id), tenue à jour à l'inscription et à chaque
+    changement de nom ou d'email.
+    """
+    __tablename__ = 'user_search'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(80), nullable=False)
+    email_local = db.Column(db.String(120), nullable=False)
+    email_domain = db.Column(db.String(120), nullable=False, default='')
+
+    __table_args__ = (
+        db.Index('ix_user_search_name', 'name'),
+        db.Index('ix_user_search_email_local', 'email_local'),
+        db.Index('ix_user_search_email_domain', 'email_domain'),
+    )
+
 class Contact(db.Model):
     __tablename__ = 'contact'
     id = db.Column(db.Integer, primary_key=True)
@@ -106,6 +202,10 @@ class Contact(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_blocked = db.Column(db.Boolean, default=False)
     nickname = db.Column(db.String(100))
+    
+    __table_args__ = (
+        db.Index('ix_contact_user_contact', 'user_id', 'contact_id'),
+    )
 
 class Invitation(db.Model):
     __tablename__ = 'invitation'
@@ -138,8 +238,8 @@ class Message(db.Model):
     original_language = db.Column(db.String(10))
     translated_language = db.Column(db.String(10))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_read = db.Column(db.Boolean, default=False)
-    is_delivered = db.Column(db.Boolean, default=False)
+    is_read = db.Column(db.Boolean, default=False)  # historique : la lecture suit Conversation.last_read_*
+    is_delivered = db.Column(db.Boolean, default=False)  # passe à True à l'accusé de réception du client
     message_type = db.Column(db.String(20), default='text')
     file_url = db.Column(db.String(500))
     file_name = db.Column(db.String(255))
@@ -150,6 +250,63 @@ class Message(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     contact_info = db.Column(db.Text)
+    seq = db.Column(db.Integer)  # numéro d'ordre dans la conversation (1, 2, 3...), voir Conversation.last_seq
+    
+    # Index des requêtes fréquentes (vérifiés par Test_database.py)
+    __table_args__ = (
+        # Historique d'une conversation, trié par date
+        db.Index('ix_message_sender_receiver_timestamp', 'sender_id', 'receiver_id', 'timestamp', 'id'),
+        # Messages d'un sens de conversation après un id : filigrane de lecture, /api/sync
+        # (id implicite en fin d'index)
+        db.Index('ix_message_receiver_sender', 'receiver_id', 'sender_id'),
+        # Statistiques de fichiers envoyés / reçus
+        db.Index('ix_message_sender_type_size', 'sender_id', 'message_type', 'file_size'),
+        db.Index('ix_message_receiver_type', 'receiver_id', 'message_type'),
+        # File de distribution : index partiel, limité aux messages non distribués
+        db.Index('ix_message_undelivered', 'receiver_id', sqlite_where=db.text('is_delivered = 0')),
+    )
+
+class Conversation(db.Model):
+    """
+    Résumé d'une conversation entre deux utilisateurs, mis à jour à chaque
+    écriture (voir save_message) : dernier message, non lus de chaque côté
+    et nombre total de messages. La paire est stockée triée (low < high).
+    
+    last_read_low / last_read_high : filigrane de lecture, id du dernier
+    message lu par chaque participant ; tout message reçu d'id supérieur
+    est non lu.
+    
+    last_seq : dernier numéro d'ordre attribué (Message.seq) ; updated_at :
+    date du dernier changement (message ou lecture), utilisée par /api/sync.
+    """
+    __tablename__ = 'conversation'
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
+    last_message_preview = db.Column(db.String(200))
+    last_message_at = db.Column(db.DateTime)
+    unread_low = db.Column(db.Integer, default=0, nullable=False)
+    unread_high = db.Column(db.Integer, default=0, nullable=False)
+    last_read_low = db.Column(db.Integer, default=0, nullable=False)
+    last_read_high = db.Column(db.Integer, default=0, nullable=False)
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    last_seq = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_users'),
+        db.Index('ix_conversation_user_high', 'user_high_id'),
+    )
+
+    def other_user_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if self.user_low_id == user_id else self.unread_high
+
+    def last_read_for(self, user_id):
+        return self.last_read_low if self.user_low_id == user_id else self.last_read_high
 
 class Group(db.Model):
     __tablename__ = 'group'
@@ -167,6 +324,11 @@ class GroupMember(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
+    
+    __table_args__ = (
+        db.Index('ix_group_member_user_group', 'user_id', 'group_id'),
+        db.Index('ix_group_member_group', 'group_id'),
+    )
 
 class GroupMessage(db.Model):
     __tablename__ = 'group_message'
@@ -230,6 +392,90 @@ def translate_text(text, target_language, source_language='auto'):
     except:
         return text
 
+# =============== PRÉSENCE ===============
+
+presence = PresenceRegistry(app.config['PRESENCE_FLUSH_INTERVAL'])
+
+def apply_presence(users):
+    """Reporte la présence en mémoire sur des utilisateurs chargés, sans les marquer modifiés"""
+    for user in users:
+        set_committed_value(user, 'is_online', presence.is_online(user.id))
+        set_committed_value(user, 'last_seen', presence.last_seen(user.id, user.last_seen))
+    return users
+
+def write_presence(rows):
+    """Écrit un lot de présences dans la table user (une seule transaction)"""
+    with app.app_context():
+        db.session.execute(db.update(User), rows)
+        db.session.commit()
+
+# =============== GRAPHE DES CONTACTS ===============
+
+contact_graph = ContactGraph(
+    load_contacts=lambda user_id: [
+        contact_id for (contact_id,) in db.session.query(Contact.contact_id).filter(Contact.user_id == user_id)
+    ],
+    load_watchers=lambda user_id: [
+        watcher_id for (watcher_id,) in db.session.query(Contact.user_id).filter(Contact.contact_id == user_id)
+    ]
+)
+
+def emit_to_watchers(user_id, event_name, data):
+    """Envoie un événement, en un seul appel, à tous ceux qui ont user_id dans leurs contacts"""
+    rooms = [f'user_{watcher_id}' for watcher_id in contact_graph.watchers_of(user_id)]
+    if rooms:
+        socketio.emit(event_name, data, to=rooms)
+
+# =============== INDEX DE RECHERCHE DES UTILISATEURS ===============
+
+def index_user(connection, user):
+    """Écrit (ou remplace) la ligne user_search d'un utilisateur, dans la transaction en cours"""
+    row = user_search.search_row(user.id, user.username, user.email)
+    connection.execute(
+        sqlite_insert(UserSearch.__table__).values(**row).on_conflict_do_update(
+            index_elements=['id'],
+            set_={'name': row['name'], 'email_local': row['email_local'], 'email_domain': row['email_domain']}
+        )
+    )
+
+@event.listens_for(User, 'after_insert')
+def index_registered_user(mapper, connection, user):
+    index_user(connection, user)
+
+@event.listens_for(User, 'after_update')
+def reindex_updated_user(mapper, connection, user):
+    state = db.inspect(user)
+    if state.attrs.username.history.has_changes() or state.attrs.email.history.has_changes():
+        index_user(connection, user)
+
+@event.listens_for(User, 'after_delete')
+def unindex_deleted_user(mapper, connection, user):
+    connection.execute(db.delete(UserSearch.__table__).where(UserSearch.__table__.c.id == user.id))
+
+# =============== ÉVÉNEMENTS ÉPHÉMÈRES ===============
+
+relay_limiter = RelayLimiter(app.config['SOCKET_RELAY_RATE'], app.config['SOCKET_RELAY_BURST'])
+
+event_coalescer = EventCoalescer(
+    emit=lambda event_name, data, room: socketio.emit(event_name, data, room=room),
+    interval=app.config['SOCKET_EVENT_INTERVAL'],
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+def relay_ephemeral(receiver_id, event_name, data, state, stream=None):
+    """
+    Relaie un événement éphémère vers receiver_id, fusionné par flux ; le seau
+    à jetons de la connexion ne limite que les envois immédiats (un état refusé
+    part en fin d'intervalle : l'état final n'est jamais perdu).
+    """
+    if receiver_id is None:
+        return
+    sid = request.sid
+    event_coalescer.submit((current_user.id, str(receiver_id), event_name, stream), state,
+                           event_name, data, f'user_{receiver_id}',
+                           allow=lambda: relay_limiter.allow(sid))
+
 def format_last_seen(dt):
     """Formate la date de dernière connexion en texte lisible"""
     if not dt:
@@ -336,6 +582,55 @@ def emit_new_message(user_id, data):
     """Émettre un nouveau message"""
     socketio.emit('direct_message', data, room=f'user_{user_id}')
 
+# =============== TRADUCTION ASYNCHRONE DES MESSAGES ===============
+
+# File non bornée : la requête qui planifie une traduction ne doit jamais attendre
+# un worker libre, car elle garde sa connexion de lecture pendant ce temps, et les
+# workers en ont besoin d'une pour enregistrer la traduction (interblocage à pool borné)
+translation_queue = eventlet.queue.LightQueue()
+translation_workers = []
+
+def translation_worker():
+    """Traite les traductions en file, une à la fois"""
+    while True:
+        task = translation_queue.get()
+        try:
+            translate_message_task(*task)
+        except Exception as e:
+            print(f"Erreur du worker de traduction: {e}")
+
+def queue_message_translation(message_id, content, from_lang, to_lang, sender_id, receiver_id):
+    """Planifie la traduction d'un message déjà enregistré et livré"""
+    while len(translation_workers) < app.config['TRANSLATION_WORKERS']:
+        translation_workers.append(eventlet.spawn(translation_worker))
+    translation_queue.put((message_id, content, from_lang, to_lang, sender_id, receiver_id))
+
+def translate_message_task(message_id, content, from_lang, to_lang, sender_id, receiver_id):
+    """Traduit un message en arrière-plan puis notifie les deux participants"""
+    try:
+        # L'appel réseau bloquant s'exécute dans un vrai thread pour ne pas figer le hub eventlet
+        translated_content = tpool.execute(translation_service.translate_message, content, from_lang, to_lang)
+    except Exception as e:
+        print(f"Erreur de traduction asynchrone du message {message_id}: {e}")
+        translated_content = content
+    
+    with app.app_context():
+        message = db.session.get(Message, message_id)
+        if not message:
+            return
+        message.translated_content = translated_content
+        db.session.commit()
+    
+    payload = {
+        'message_id': message_id,
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'translated_content': translated_content,
+        'translated_language': to_lang
+    }
+    socketio.emit('message_translated', payload, room=f'user_{receiver_id}')
+    socketio.emit('message_translated', payload, room=f'user_{sender_id}')
+
 # =============== ROUTES PRINCIPALES ===============
 
 @app.route('/')
@@ -363,9 +658,7 @@ def login():
                     return render_template('login.html')
             
             login_user(user)
-            user.is_online = True
-            user.last_seen = datetime.utcnow()
-            db.session.commit()
+            presence.seen(user.id)
             
             next_page = request.args.get('next')
             return redirect(next_page or url_for('chat'))
@@ -427,50 +720,81 @@ def register_html():
 @login_required
 def logout():
     if current_user.is_authenticated:
-        current_user.is_online = False
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        presence.seen(current_user.id)
     
     logout_user()
     return redirect(url_for('index'))
 
+def contact_users(user_id):
+    """Utilisateurs contacts de user_id, chargés en une seule requête"""
+    return User.query.join(Contact, Contact.contact_id == User.id).filter(
+        Contact.user_id == user_id
+    ).order_by(Contact.id).all()
+
+def user_groups(user_id):
+    """Groupes de user_id avec leur nombre de membres, en une seule requête"""
+    member_count = db.session.query(db.func.count(GroupMember.id)).filter(
+        GroupMember.group_id == Group.id
+    ).correlate(Group).scalar_subquery()
+    
+    groups = []
+    for group, count in db.session.query(Group, member_count).join(
+        GroupMember, GroupMember.group_id == Group.id
+    ).filter(GroupMember.user_id == user_id).order_by(GroupMember.id).all():
+        group.member_count = count
+        groups.append(group)
+    return groups
+
 @app.route('/chat')
 @login_required
 def chat():
-    contacts = Contact.query.filter_by(user_id=current_user.id).all()
+    started_at = datetime.utcnow()
+    conversations = {
+        conversation.other_user_id(current_user.id): conversation
+        for conversation in user_conversations(current_user.id).all()
+    }
     contact_list = []
     
-    for contact in contacts:
-        contact_user = User.query.get(contact.contact_id)
-        if contact_user:
-            contact_list.append({
-                'id': contact_user.id,
-                'username': contact_user.username,
-                'status': contact_user.status,
-                'is_online': contact_user.is_online,
-                'language': contact_user.language,
-                'profile_picture': contact_user.profile_picture,
-                'avatar_url': contact_user.avatar_url,
-                'last_seen': contact_user.last_seen.strftime('%H:%M') if contact_user.last_seen else ''
-            })
+    for contact_user in apply_presence(contact_users(current_user.id)):
+        conversation = conversations.get(contact_user.id)
+        contact_list.append({
+            'id': contact_user.id,
+            'username': contact_user.username,
+            'status': contact_user.status,
+            'is_online': contact_user.is_online,
+            'language': contact_user.language,
+            'profile_picture': contact_user.profile_picture,
+            'avatar_url': contact_user.avatar_url,
+            'last_seen': contact_user.last_seen.strftime('%H:%M') if contact_user.last_seen else '',
+            'last_message': conversation.last_message_preview if conversation else '',
+            'last_message_time': conversation.last_message_at.strftime('%H:%M') if conversation and conversation.last_message_at else '',
+            'last_message_at': conversation.last_message_at.isoformat() if conversation and conversation.last_message_at else '',
+            'unread_count': conversation.unread_for(current_user.id) if conversation else 0
+        })
+    
+    # Conversations les plus récentes en premier
+    contact_list.sort(key=lambda c: c['last_message_at'], reverse=True)
     
-    groups = GroupMember.query.filter_by(user_id=current_user.id).all()
     group_list = []
     
-    for member in groups:
-        group = Group.query.get(member.group_id)
-        if group:
-            group_list.append({
-                'id': group.id,
-                'name': group.name,
-                'description': group.description,
-                'member_count': GroupMember.query.filter_by(group_id=group.id).count()
-            })
+    for group in user_groups(current_user.id):
+        group_list.append({
+            'id': group.id,
+            'name': group.name,
+            'description': group.description,
+            'member_count': group.member_count
+        })
+    
+    # Point de départ du rattrapage après une reconnexion (/api/sync)
+    sync_cursor = encode_sync_cursor(started_at, max(
+        (conversation.last_message_id or 0 for conversation in conversations.values()), default=0
+    ))
     
     return render_template('chat.html', 
                           contacts=contact_list,
                           groups=group_list,
-                          user_language=current_user.language)
+                          user_language=current_user.language,
+                          sync_cursor=sync_cursor)
 
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -528,62 +852,154 @@ def download():
 
 # =============== ROUTES DE GESTION DES CONTACTS (VERSION AMÉLIORÉE) ===============
 
+# Ordres de tri de l'annuaire : (colonnes de la clé, décroissant) ; chaque clé est
+# unique et couverte par un index, pour reprendre la page suivante par une recherche.
+# Les utilisateurs dont la première colonne est NULL viennent après tous les autres
+DIRECTORY_SORTS = {
+    'username': ((User.username,), False),
+    'username_desc': ((User.username,), True),
+    'recent': ((User.last_seen, User.id), True),
+    'oldest': ((User.last_seen, User.id), False),
+    'language': ((User.language, User.username), False)
+}
+
+# Colonnes affichées par l'annuaire (ni bio ni mot de passe)
+DIRECTORY_COLUMNS = (User.id, User.username, User.email, User.language, User.avatar_url,
+                     User.last_seen, User.created_at)
+
+directory_count = {'value': 0, 'expires': 0.0}
+
+def registered_users_count():
+    """Nombre d'utilisateurs inscrits, recompté au plus une fois par DIRECTORY_COUNT_TTL secondes"""
+    now = time.monotonic()
+    if now >= directory_count['expires']:
+        directory_count['value'] = db.session.query(db.func.count(User.id)).scalar()
+        directory_count['expires'] = now + app.config['DIRECTORY_COUNT_TTL']
+    return directory_count['value']
+
+def directory_query(user_id, sort='username', language=None, status=None, after=None, null_keys=False):
+    """
+    Annuaire des utilisateurs (sauf user_id) dans l'ordre sort, à partir de la
+    clé after (valeurs de la clé de tri de la dernière ligne déjà affichée).
+    Une valeur NULL ne se compare pas : si la première colonne de la clé peut
+    être NULL, la requête ne parcourt que les lignes où elle ne l'est pas, ou,
+    avec null_keys (ou un curseur qui y est déjà), celles où elle l'est, triées
+    par le reste de la clé ; chaque partie suit l'ordre d'un index.
+    """
+    columns, descending = DIRECTORY_SORTS[sort]
+    query = db.session.query(*DIRECTORY_COLUMNS).filter(User.id != user_id)
+    if columns[0].nullable:
+        if null_keys or (after is not None and after[0] is None):
+            query = query.filter(columns[0].is_(None))
+            columns, after = columns[1:], after[1:] if after is not None else None
+        else:
+            query = query.filter(columns[0].isnot(None))
+
+    if language:
+        query = query.filter(User.language == language)
+    if status in ('online', 'offline', 'recent'):
+        online_ids = presence.online_user_ids()
+        if status == 'online':
+            query = query.filter(User.id.in_(online_ids))
+        elif status == 'offline':
+            query = query.filter(User.id.notin_(online_ids))
+        else:
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            query = query.filter((User.last_seen >= today) | User.id.in_(online_ids))
+
+    if after is not None:
+        key = db.tuple_(*columns)
+        values = db.tuple_(*[db.literal(value, column.type) for column, value in zip(columns, after)])
+        query = query.filter(key < values if descending else key > values)
+
+    return query.order_by(*[column.desc() if descending else column for column in columns])
+
+def directory_page(user_id, sort='username', language=None, status=None, after=None, limit=30):
+    """
+    Une page de l'annuaire, paginée par clé (voir directory_query).
+    Retourne (lignes, clé de la dernière ligne si d'autres suivent, sinon None).
+    """
+    columns, _ = DIRECTORY_SORTS[sort]
+    rows = directory_query(user_id, sort, language, status, after).limit(limit + 1).all()
+    if columns[0].nullable and len(rows) <= limit and (after is None or after[0] is not None):
+        # Fin des clés renseignées : la page continue avec les clés NULL
+        rows += directory_query(user_id, sort, language, status, null_keys=True).limit(limit + 1 - len(rows)).all()
+    page = rows[:limit]
+    has_more = len(rows) > limit
+    return page, [getattr(page[-1], column.key) for column in columns] if has_more else None
+
+def encode_directory_cursor(values):
+    """Curseur de l'annuaire : clé de tri de la dernière ligne, en JSON"""
+    return json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+
+def decode_directory_cursor(cursor, sort):
+    """Décode un curseur de l'annuaire pour l'ordre de tri sort ; retourne None s'il est invalide"""
+    columns, _ = DIRECTORY_SORTS[sort]
+    try:
+        values = json.loads(cursor)
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) and value is not None else value
+                for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        return None
+
+def directory_entry(row, contact_ids, invited_emails):
+    """Carte de l'annuaire d'un utilisateur (ligne de directory_page), présence en mémoire comprise"""
+    last_seen = presence.last_seen(row.id, row.last_seen)
+    return {
+        'id': row.id,
+        'username': row.username,
+        'email': row.email,
+        'language': row.language,
+        'language_name': app.config['SUPPORTED_LANGUAGES'].get(row.language, row.language),
+        'avatar_url': row.avatar_url,
+        'is_online': presence.is_online(row.id),
+        'last_seen_formatted': format_last_seen(last_seen),
+        'last_seen_timestamp': int(last_seen.timestamp()) if last_seen else 0,
+        'joined_date_formatted': row.created_at.strftime('%d/%m/%Y') if row.created_at else 'Inconnue',
+        'is_contact': row.id in contact_ids,
+        'invitation_pending': row.email in invited_emails
+    }
+
+def pending_invitation_emails(user_id):
+    """Emails invités par user_id dont l'invitation est en attente"""
+    return {email for (email,) in db.session.query(Invitation.recipient_email).filter_by(
+        sender_id=user_id, status='pending'
+    )}
+
 @app.route('/contacts')
 @login_required
 def contacts():
-    """Page principale des contacts avec tous les utilisateurs et invitations"""
-    
-    # 🔴 TOUS les utilisateurs sauf l'utilisateur courant
-    all_users = User.query.filter(User.id != current_user.id).order_by(User.username).all()
+    """
+    Page principale des contacts et invitations ; l'annuaire (onglet Explorer)
+    n'affiche que sa première page, la suite est chargée par /api/users
+    """
     
-    # ✅ CORRECTION: Récupérer les contacts - SANS .all()
-    contact_objects = []
-    contact_ids = []
-    
-    for contact_rel in current_user.contacts:  # InstrumentedList, pas besoin de .all()
-        contact_user = User.query.get(contact_rel.contact_id)
-        if contact_user:
-            contact_objects.append(contact_user)
-            contact_ids.append(contact_user.id)
+    # Contacts de l'utilisateur (une seule requête avec jointure)
+    contact_objects = contact_users(current_user.id)
+    contact_ids = {contact.id for contact in contact_objects}
     
     # Récupérer les invitations envoyées (par email)
     invitations = Invitation.query.filter_by(
         sender_id=current_user.id, 
         status='pending'
     ).order_by(Invitation.created_at.desc()).all()
+    invited_emails = {invitation.recipient_email for invitation in invitations}
     
-    # IDs des utilisateurs avec invitation en attente
-    pending_invitation_ids = []
-    for invitation in Invitation.query.filter_by(
-        sender_id=current_user.id, 
-        status='pending'
-    ).all():
-        user = User.query.filter_by(email=invitation.recipient_email).first()
-        if user:
-            pending_invitation_ids.append(user.id)
+    # Première page de l'annuaire
+    rows, next_key = directory_page(current_user.id, limit=app.config['DIRECTORY_PAGE_SIZE'])
+    directory = [directory_entry(row, contact_ids, invited_emails) for row in rows]
     
     # Récupérer les groupes dont l'utilisateur est membre
-    group_memberships = GroupMember.query.filter_by(user_id=current_user.id).all()
-    groups = []
-    for membership in group_memberships:
-        group = Group.query.get(membership.group_id)
-        if group:
-            group.member_count = GroupMember.query.filter_by(group_id=group.id).count()
-            groups.append(group)
-    
-    # Statistiques
-    online_users_count = User.query.filter(
-        User.is_online == True, 
-        User.id != current_user.id
-    ).count()
+    groups = user_groups(current_user.id)
     
-    pending_invitations_count = len(invitations)
+    # Statistiques (présence en mémoire, nombre d'inscrits mis en cache)
+    apply_presence(contact_objects)
+    online_users_count = len(presence.online_user_ids() - {current_user.id})
+    total_users_count = max(registered_users_count() - 1, 0)
     
-    # Formater les dates pour tous les utilisateurs
-    for user in all_users:
-        user.last_seen_formatted = format_last_seen(user.last_seen)
-        user.joined_date_formatted = user.created_at.strftime('%d/%m/%Y') if user.created_at else 'Inconnue'
-        user.last_seen_timestamp = int(user.last_seen.timestamp()) if user.last_seen else 0
+    pending_invitations_count = len(invitations)
     
     for contact in contact_objects:
         contact.last_seen_formatted = format_last_seen(contact.last_seen)
@@ -592,9 +1008,9 @@ def contacts():
     return render_template(
         'contacts.html',
         contacts=contact_objects,
-        all_users=all_users,
-        contact_ids=contact_ids,
-        pending_invitation_ids=pending_invitation_ids,
+        all_users=directory,
+        directory_cursor=encode_directory_cursor(next_key) if next_key else None,
+        total_users_count=total_users_count,
         invitations=invitations,
         groups=groups,
         online_users_count=online_users_count,
@@ -602,6 +1018,38 @@ def contacts():
         config={'SUPPORTED_LANGUAGES': app.config['SUPPORTED_LANGUAGES']}
     )
 
+@app.route('/api/users')
+@login_required
+def directory_users():
+    """
+    Annuaire des utilisateurs (onglet Explorer), paginé par clé.
+    `sort` : username, username_desc, recent, oldest ou language ;
+    `language`, `status` (online, offline, recent) : filtres ; `after` : curseur.
+    """
+    sort = request.args.get('sort', 'username')
+    if sort not in DIRECTORY_SORTS:
+        sort = 'username'
+    limit = max(1, min(request.args.get('limit', app.config['DIRECTORY_PAGE_SIZE'], type=int) or 1,
+                       app.config['DIRECTORY_MAX_PAGE_SIZE']))
+    after = request.args.get('after')
+    if after:
+        after = decode_directory_cursor(after, sort)
+        if after is None:
+            return jsonify({'error': 'Curseur invalide'}), 400
+    
+    rows, next_key = directory_page(
+        current_user.id, sort=sort, language=request.args.get('language') or None,
+        status=request.args.get('status'), after=after, limit=limit
+    )
+    contact_ids = contact_graph.contacts_of(current_user.id)
+    invited_emails = pending_invitation_emails(current_user.id)
+    
+    return jsonify({
+        'users': [directory_entry(row, contact_ids, invited_emails) for row in rows],
+        'has_more': next_key is not None,
+        'next_cursor': encode_directory_cursor(next_key) if next_key else None
+    })
+
 @app.route('/add_contact/<int:user_id>', methods=['POST'])
 @login_required
 def add_contact(user_id):
@@ -690,6 +1138,7 @@ def remove_contact(user_id):
         db.session.delete(contact2)
     
     db.session.commit()
+    contact_graph.invalidate(current_user.id, user_id)
     
     # Notification à l'autre utilisateur
     socketio.emit('contact_removed', {
@@ -837,38 +1286,33 @@ def cancel_email_invitation(invitation_id):
 @app.route('/api/search_users')
 @login_required
 def search_users():
-    """Rechercher des utilisateurs"""
+    """
+    Rechercher des utilisateurs (nom ou partie locale de l'email, sans tenir
+    compte des accents ; adresse ou domaine si la saisie contient '@'),
+    contacts en premier ; voir user_search.py
+    """
     
     query = request.args.get('q', '')
     
     if len(query) < 2:
         return jsonify({'users': []})
     
-    users = User.query.filter(
-        User.id != current_user.id,
-        (User.username.ilike(f'%{query}%') | User.email.ilike(f'%{query}%'))
-    ).limit(20).all()
+    contact_ids = contact_graph.contacts_of(current_user.id)
     
-    # ✅ CORRECTION: Récupérer les IDs des contacts SANS .all()
-    contact_ids = []
-    for contact_rel in current_user.contacts:
-        contact_ids.append(contact_rel.contact_id)
+    # Lecture seule : sur le pool de lecture en mode production
+    with db.engines.get(sqlite_tuning.READER_BIND, db.engine).connect() as connection:
+        user_ids = user_search.search(connection, query, exclude_id=current_user.id, contact_ids=contact_ids)
     
-    users_data = []
-    for user in users:
-        users_data.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'language': user.language,
-            'language_name': app.config['SUPPORTED_LANGUAGES'].get(user.language, user.language),
-            'profile_image': user.avatar_url,
-            'is_online': user.is_online,
-            'is_contact': user.id in contact_ids,
-            'avatar_url': user.avatar_url
-        })
+    if not user_ids:
+        return jsonify({'users': []})
+    
+    # Mêmes cartes que l'annuaire (/api/users), dans l'ordre du classement
+    found = {row.id: row for row in db.session.query(*DIRECTORY_COLUMNS).filter(User.id.in_(user_ids))}
+    invited_emails = pending_invitation_emails(current_user.id)
     
-    return jsonify({'users': users_data})
+    return jsonify({'users': [
+        directory_entry(found[user_id], contact_ids, invited_emails) for user_id in user_ids if user_id in found
+    ]})
 
 @app.route('/api/user_profile/<int:user_id>')
 @login_required
@@ -879,13 +1323,9 @@ def user_profile(user_id):
     
     if not user:
         return jsonify({'success': False, 'error': 'Utilisateur non trouvé'}), 404
+    apply_presence([user])
     
-    # ✅ CORRECTION: Vérifier si c'est un contact SANS .all()
-    is_contact = False
-    for contact_rel in current_user.contacts:
-        if contact_rel.contact_id == user.id:
-            is_contact = True
-            break
+    is_contact = user.id in contact_graph.contacts_of(current_user.id)
     
     profile_data = {
         'id': user.id,
@@ -921,39 +1361,39 @@ def send_translated_message():
     if not recipient:
         return jsonify({'success': False, 'error': 'Destinataire non trouvé'}), 404
     
-    # Traduire le message
-    translated_message = translate_text(message, target_language)
-    
-    # Créer le message
+    # Créer le message, la traduction arrive ensuite par l'événement message_translated
     new_message = Message(
         sender_id=current_user.id,
         receiver_id=recipient.id,
         content=message,
-        translated_content=translated_message,
+        translated_content=None,
         original_language=current_user.language,
         translated_language=target_language,
-        timestamp=datetime.utcnow(),
-        is_delivered=True
+        timestamp=datetime.utcnow()
     )
     
-    db.session.add(new_message)
-    db.session.commit()
+    save_message(new_message)
     
     # Notification en temps réel
     socketio.emit('new_message', {
         'message_id': new_message.id,
+        'seq': new_message.seq,
         'sender_id': current_user.id,
         'sender_name': current_user.username,
         'sender_avatar': current_user.avatar_url,
         'receiver_id': recipient.id,
         'content': message,
-        'translated_content': translated_message,
+        'translated_content': None,
+        'translation_pending': True,
         'timestamp': new_message.timestamp.strftime('%H:%M')
     }, room=f'user_{recipient.id}')
     
+    queue_message_translation(new_message.id, message, 'auto', target_language, current_user.id, recipient.id)
+    
     return jsonify({
         'success': True,
-        'translated_message': translated_message,
+        'translated_message': None,
+        'translation_pending': True,
         'message_id': new_message.id
     })
 
@@ -1011,33 +1451,490 @@ def create_group():
 
 # =============== ROUTES POUR LES MESSAGES ===============
 
+FILE_MESSAGE_TYPES = ['file', 'multiple_files', 'voice']
+
+def conversation_direction(sender_id, receiver_id, before=None, after=None):
+    """
+    Messages d'un sens d'une conversation, dans l'ordre de l'index
+    (sender_id, receiver_id, timestamp, id) : du plus récent au plus ancien,
+    ou du plus ancien au plus récent avec `after`. `before` / `after` : curseur
+    (horodatage, id) exclu.
+    """
+    query = Message.query.filter(Message.sender_id == sender_id, Message.receiver_id == receiver_id)
+    key = db.tuple_(Message.timestamp, Message.id)
+    if after:
+        return query.filter(key > db.tuple_(db.literal(after[0], db.DateTime), after[1])).order_by(
+            Message.timestamp.asc(), Message.id.asc())
+    if before:
+        query = query.filter(key < db.tuple_(db.literal(before[0], db.DateTime), before[1]))
+    return query.order_by(Message.timestamp.desc(), Message.id.desc())
+
+def conversation_page(user_id, contact_id, limit, before=None, after=None):
+    """
+    Une page de l'historique entre deux utilisateurs (voir conversation_direction) :
+    chaque sens est lu dans l'index avec sa propre limite, puis les deux sont
+    fusionnés ; le coût ne dépend pas de la longueur de la conversation.
+    Retourne (messages dans l'ordre de lecture de l'index, d'autres suivent).
+    """
+    directions = [
+        conversation_direction(user_id, contact_id, before, after).limit(limit + 1).all(),
+        conversation_direction(contact_id, user_id, before, after).limit(limit + 1).all()
+    ]
+    merged = list(heapq.merge(*directions, key=lambda message: (message.timestamp, message.id),
+                              reverse=not after))
+    return merged[:limit], len(merged) > limit
+
+def unread_messages(user_id, contact_id, last_read_id=0):
+    """Requête des messages envoyés par contact_id à user_id après le filigrane de lecture"""
+    return Message.query.filter(
+        Message.receiver_id == user_id,
+        Message.sender_id == contact_id,
+        Message.id > last_read_id
+    )
+
+def undelivered_messages(user_id, after_id=0):
+    """Requête des messages reçus par user_id sans accusé de réception, dans l'ordre d'envoi"""
+    return Message.query.filter(
+        Message.receiver_id == user_id,
+        Message.is_delivered == db.false(),
+        Message.id > after_id
+    ).order_by(Message.id)
+
+def conversation_pair(user_id, contact_id):
+    """Identifiants (low, high) de la conversation entre deux utilisateurs"""
+    user_id, contact_id = int(user_id), int(contact_id)
+    return (user_id, contact_id) if user_id <= contact_id else (contact_id, user_id)
+
+def user_conversations(user_id):
+    """Requête des résumés de conversation d'un utilisateur"""
+    return Conversation.query.filter(
+        (Conversation.user_low_id == user_id) | (Conversation.user_high_id == user_id)
+    )
+
+def message_preview(content):
+    """Aperçu d'un message pour la liste des conversations"""
+    content = ' '.join((content or '').split())
+    limit = app.config['MESSAGE_PREVIEW_LENGTH']
+    return content if len(content) <= limit else content[:limit - 1] + '…'
+
+def record_conversation(message):
+    """Met à jour le résumé de conversation d'un message inséré (flush fait, sans commit)"""
+    low, high = conversation_pair(message.sender_id, message.receiver_id)
+    unread = Conversation.unread_low if int(message.receiver_id) == low else Conversation.unread_high
+
+    db.session.execute(
+        sqlite_insert(Conversation)
+        .values(user_low_id=low, user_high_id=high)
+        .on_conflict_do_nothing(index_elements=['user_low_id', 'user_high_id'])
+    )
+    message.seq = db.session.execute(
+        db.update(Conversation)
+        .where(Conversation.user_low_id == low, Conversation.user_high_id == high)
+        .values({
+            Conversation.last_message_id: message.id,
+            Conversation.last_message_preview: message_preview(message.content),
+            Conversation.last_message_at: message.timestamp,
+            Conversation.message_count: Conversation.message_count + 1,
+            Conversation.last_seq: Conversation.last_seq + 1,
+            Conversation.updated_at: datetime.utcnow(),
+            unread: unread + 1
+        })
+        .returning(Conversation.last_seq)
+    ).scalar()
+
+# Écriture groupée des messages (voir write_behind.py), désactivée par défaut
+message_writer = GroupCommitWriter(
+    app, db, Message,
+    after_flush=record_conversation,
+    window_ms=app.config['MESSAGE_WRITE_BEHIND_WINDOW_MS'],
+    max_rows=app.config['MESSAGE_WRITE_BEHIND_MAX_ROWS'],
+    durability=app.config['MESSAGE_WRITE_BEHIND_DURABILITY']
+) if app.config['MESSAGE_WRITE_BEHIND'] else None
+
+def save_message(message):
+    """
+    Enregistre un message et met à jour le résumé de sa conversation
+    dans la même transaction (dans un lot partagé si l'écriture groupée est active).
+    """
+    if message_writer is not None:
+        # Terminer la transaction de la requête : ses connexions retournent au pool pendant l'attente
+        db.session.commit()
+        return message_writer.submit(message)
+
+    db.session.add(message)
+    db.session.flush()
+    record_conversation(message)
+    db.session.commit()
+    return message
+
+def find_conversation(user_id, contact_id):
+    """Résumé de la conversation entre deux utilisateurs, ou None"""
+    low, high = conversation_pair(user_id, contact_id)
+    return Conversation.query.filter_by(user_low_id=low, user_high_id=high).first()
+
+def advance_read_watermark(user_id, contact_id, message_id=None):
+    """
+    Avance le filigrane de lecture de user_id jusqu'à message_id (par défaut
+    le dernier message, et jamais au-delà) et recalcule ses non lus, en une seule requête UPDATE.
+    Retourne le nouveau filigrane (None sans conversation) ; sans commit.
+    """
+    low, high = conversation_pair(user_id, contact_id)
+    if int(user_id) == low:
+        last_read, unread = Conversation.last_read_low, Conversation.unread_low
+    else:
+        last_read, unread = Conversation.last_read_high, Conversation.unread_high
+    
+    if message_id is None:
+        target = Conversation.last_message_id
+    else:
+        target = db.case((Conversation.last_message_id < message_id, Conversation.last_message_id),
+                         else_=message_id)
+    watermark = db.case((last_read > target, last_read), else_=target)
+    remaining = db.session.query(db.func.count(Message.id)).filter(
+        Message.receiver_id == user_id,
+        Message.sender_id == contact_id,
+        Message.id > watermark
+    ).scalar_subquery()
+    
+    return db.session.execute(
+        db.update(Conversation)
+        .where(Conversation.user_low_id == low, Conversation.user_high_id == high)
+        .values({
+            last_read: watermark,
+            unread: 0 if message_id is None else remaining,
+            Conversation.updated_at: datetime.utcnow()
+        })
+        .returning(last_read)
+    ).scalar()
+
+def rebuild_conversations(backfill_watermarks=False):
+    """
+    Reconstruit tous les résumés de conversation (et les Message.seq) à partir de la table message.
+    Les filigranes de lecture existants sont conservés ; ils ne sont déduits de
+    Message.is_read que pour les conversations sans résumé, ou pour toutes si
+    backfill_watermarks (colonnes de filigrane tout juste ajoutées).
+    """
+    watermarks = {}
+    if not backfill_watermarks:
+        watermarks = {
+            (row.user_low_id, row.user_high_id): (row.last_read_low, row.last_read_high)
+            for row in db.session.query(
+                Conversation.user_low_id, Conversation.user_high_id,
+                Conversation.last_read_low, Conversation.last_read_high
+            )
+        }
+    
+    summaries = {}
+    sequences = []
+    rows = db.session.query(
+        Message.id, Message.sender_id, Message.receiver_id, Message.content, Message.timestamp, Message.seq
+    ).order_by(Message.timestamp, Message.id).yield_per(1000)
+    
+    for row in rows:
+        low, high = conversation_pair(row.sender_id, row.receiver_id)
+        summary = summaries.setdefault((low, high), {
+            'user_low_id': low, 'user_high_id': high,
+            'unread_low': 0, 'unread_high': 0, 'message_count': 0
+        })
+        summary.update(
+            last_message_id=row.id,
+            last_message_preview=message_preview(row.content),
+            last_message_at=row.timestamp,
+            updated_at=row.timestamp
+        )
+        summary['message_count'] += 1
+        summary['last_seq'] = summary['message_count']
+        if row.seq != summary['last_seq']:
+            sequences.append({'id': row.id, 'seq': summary['last_seq']})
+    
+    # Filigranes à déduire de is_read : juste avant le premier message reçu non lu (ou le dernier message)
+    first_unread = {}
+    if len(watermarks) < len(summaries):
+        first_unread = {
+            (receiver_id, sender_id): message_id
+            for receiver_id, sender_id, message_id in db.session.query(
+                Message.receiver_id, Message.sender_id, db.func.min(Message.id)
+            ).filter(Message.is_read == False).group_by(Message.receiver_id, Message.sender_id)
+        }
+    for (low, high), summary in summaries.items():
+        if (low, high) in watermarks:
+            summary['last_read_low'], summary['last_read_high'] = watermarks[(low, high)]
+            continue
+        for key, user_id, contact_id in (('last_read_low', low, high), ('last_read_high', high, low)):
+            first = first_unread.get((user_id, contact_id))
+            summary[key] = first - 1 if first is not None else summary['last_message_id']
+    
+    for start in range(0, len(sequences), 1000):
+        db.session.execute(db.update(Message), sequences[start:start + 1000])
+    
+    Conversation.query.delete()
+    if summaries:
+        db.session.execute(db.insert(Conversation), list(summaries.values()))
+    
+    # Non lus : messages reçus après le filigrane
+    for user_column, contact_column, last_read, unread in (
+        (Conversation.user_low_id, Conversation.user_high_id, Conversation.last_read_low, Conversation.unread_low),
+        (Conversation.user_high_id, Conversation.user_low_id, Conversation.last_read_high, Conversation.unread_high)
+    ):
+        db.session.execute(db.update(Conversation).values({
+            unread: unread_messages(user_column, contact_column, last_read)
+                .with_entities(db.func.count(Message.id)).scalar_subquery()
+        }))
+    db.session.commit()
+    return len(summaries)
+
+def encode_message_cursor(message):
+    """Curseur de pagination d'un message : (horodatage, id)"""
+    return f"{message.timestamp.isoformat()}_{message.id}"
+
+def decode_message_cursor(cursor):
+    """Décode un curseur de pagination ; retourne (datetime, id) ou None"""
+    try:
+        timestamp, message_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, AttributeError):
+        return None
+
+def message_payload(msg):
+    """Représentation JSON d'un message (historique et rattrapage)"""
+    return {
+        'id': msg.id,
+        'seq': msg.seq,
+        'sender_id': msg.sender_id,
+        'receiver_id': msg.receiver_id,
+        'content': msg.content,
+        'translated_content': msg.translated_content,
+        'translation_pending': msg.translated_content is None and msg.original_language != msg.translated_language,
+        'timestamp': msg.timestamp.strftime('%H:%M'),
+        'is_delivered': bool(msg.is_delivered),
+        'message_type': msg.message_type,
+        'file_url': msg.file_url,
+        'file_name': msg.file_name,
+        'file_size': msg.file_size,
+        'duration': msg.duration,
+        'latitude': msg.latitude,
+        'longitude': msg.longitude
+    }
+
+def direction_messages_after(sender_id, receiver_id, message_id):
+    """Requête des messages de sender_id à receiver_id d'id supérieur à message_id, dans l'ordre d'écriture"""
+    return Message.query.filter(
+        Message.receiver_id == receiver_id,
+        Message.sender_id == sender_id,
+        Message.id > message_id
+    ).order_by(Message.id)
+
+def user_messages_after(user_id, message_id, limit):
+    """
+    Les `limit` premiers messages envoyés ou reçus par user_id d'id supérieur à
+    message_id, dans l'ordre d'écriture. Seules les conversations dont le dernier
+    message est plus récent sont lues, chaque sens par un intervalle d'id dans
+    ix_message_receiver_sender (une seule requête UNION ALL), puis fusionnées.
+    """
+    pairs = db.session.query(Conversation.user_low_id, Conversation.user_high_id).filter(
+        (Conversation.user_low_id == user_id) | (Conversation.user_high_id == user_id),
+        Conversation.last_message_id > message_id
+    ).all()
+    arms = [
+        db.select(direction_messages_after(sender_id, receiver_id, message_id)
+                  .with_entities(Message.id).limit(limit).subquery().c.id)
+        for low, high in pairs for sender_id, receiver_id in ((low, high), (high, low))
+    ]
+    ids = []
+    # SQLite limite le nombre de SELECT d'une requête composée (500)
+    for start in range(0, len(arms), 400):
+        ids.extend(db.session.execute(db.union_all(*arms[start:start + 400])).scalars())
+    ids = sorted(ids)[:limit]
+    return Message.query.filter(Message.id.in_(ids)).order_by(Message.id).all() if ids else []
+
+def encode_sync_cursor(synced_at, message_id):
+    """Curseur de /api/sync : (date de synchro moins le recouvrement, dernier id de message vu)"""
+    synced_at -= timedelta(seconds=app.config['SYNC_OVERLAP_SECONDS'])
+    return f"{synced_at.isoformat()}_{message_id}"
+
 @app.route('/get_messages/<int:contact_id>')
 @login_required
 def get_messages(contact_id):
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == contact_id)) |
-        ((Message.sender_id == contact_id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).all()
+    """
+    Historique d'une conversation, paginé par curseur (horodatage, id).
+    Sans paramètre : les `limit` messages les plus récents.
+    `before` : messages plus anciens que le curseur ("charger plus").
+    `after` : messages plus récents que le curseur (rattrapage).
+    """
+    limit = max(1, min(request.args.get('limit', app.config['MESSAGES_PAGE_SIZE'], type=int) or 1,
+                       app.config['MESSAGES_MAX_PAGE_SIZE']))
+    before = request.args.get('before')
+    after = request.args.get('after')
+    
+    cursors = {}
+    for name, value in (('before', before), ('after', after)):
+        if value:
+            cursors[name] = decode_message_cursor(value)
+            if not cursors[name]:
+                return jsonify({'error': 'Curseur invalide'}), 400
+    
+    messages, has_more = conversation_page(current_user.id, contact_id, limit,
+                                           before=cursors.get('before'), after=cursors.get('after'))
+    if not after:
+        messages.reverse()
+    
+    # Lu / non lu selon le filigrane de lecture du destinataire
+    conversation = find_conversation(current_user.id, contact_id)
+    read_by_me = conversation.last_read_for(current_user.id) if conversation else 0
+    read_by_contact = conversation.last_read_for(contact_id) if conversation else 0
     
     messages_list = []
     for msg in messages:
-        messages_list.append({
-            'id': msg.id,
-            'sender_id': msg.sender_id,
-            'content': msg.content,
-            'translated_content': msg.translated_content,
-            'timestamp': msg.timestamp.strftime('%H:%M'),
-            'is_read': msg.is_read,
-            'message_type': msg.message_type,
-            'file_url': msg.file_url,
-            'file_name': msg.file_name,
-            'file_size': msg.file_size,
-            'duration': msg.duration,
-            'latitude': msg.latitude,
-            'longitude': msg.longitude
+        item = message_payload(msg)
+        item['is_read'] = msg.id <= (read_by_contact if msg.sender_id == current_user.id else read_by_me)
+        messages_list.append(item)
+    
+    return jsonify({
+        'messages': messages_list,
+        'last_read_id': read_by_contact,
+        'has_more': has_more,
+        'before_cursor': encode_message_cursor(messages[0]) if messages else before,
+        'after_cursor': encode_message_cursor(messages[-1]) if messages else after
+    })
+
+@app.route('/api/sync')
+@login_required
+def sync():
+    """
+    Rattrapage après une coupure : tout ce qui a changé depuis le curseur `since`
+    (nouveaux messages, filigranes de lecture, invitations, présence des contacts)
+    en une seule réponse. Sans curseur : état courant, sans les messages.
+    Les changements proches du curseur peuvent être renvoyés deux fois.
+    """
+    started_at = datetime.utcnow()
+    since = request.args.get('since')
+    user_id = current_user.id
+    changed_since, last_message_id = None, 0
+    if since:
+        cursor = decode_message_cursor(since)
+        if not cursor:
+            return jsonify({'error': 'Curseur invalide'}), 400
+        changed_since, last_message_id = cursor
+    
+    # Nouveaux messages, dans l'ordre d'écriture
+    messages, has_more = [], False
+    if changed_since is not None:
+        limit = app.config['SYNC_MAX_MESSAGES']
+        messages = user_messages_after(user_id, last_message_id, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if messages:
+            last_message_id = messages[-1].id
+    
+    # Conversations modifiées : dernier numéro d'ordre, non lus et filigranes de lecture
+    conversations = user_conversations(user_id)
+    if changed_since is not None:
+        conversations = conversations.filter(Conversation.updated_at > changed_since)
+    conversation_list = []
+    for conversation in conversations.all():
+        contact_id = conversation.other_user_id(user_id)
+        if changed_since is None:
+            last_message_id = max(last_message_id, conversation.last_message_id or 0)
+        conversation_list.append({
+            'contact_id': contact_id,
+            'last_seq': conversation.last_seq,
+            'last_message_id': conversation.last_message_id,
+            'last_message': conversation.last_message_preview or '',
+            'last_message_time': conversation.last_message_at.strftime('%H:%M') if conversation.last_message_at else '',
+            'unread_count': conversation.unread_for(user_id),
+            'last_read_id': conversation.last_read_for(user_id),
+            'contact_last_read_id': conversation.last_read_for(contact_id)
+        })
+    
+    # Invitations en attente reçues depuis le curseur
+    invitations = []
+    contact_invitations = db.session.query(ContactInvitation, User).join(
+        User, User.id == ContactInvitation.sender_id
+    ).filter(ContactInvitation.receiver_id == user_id, ContactInvitation.status == 'pending')
+    email_invitations = db.session.query(Invitation, User).join(
+        User, User.id == Invitation.sender_id
+    ).filter(Invitation.recipient_email == current_user.email, Invitation.status == 'pending')
+    if changed_since is not None:
+        contact_invitations = contact_invitations.filter(ContactInvitation.created_at > changed_since)
+        email_invitations = email_invitations.filter(Invitation.created_at > changed_since)
+    for source, query in (('contact_invitation', contact_invitations), ('invitation', email_invitations)):
+        for invitation, sender in query.all():
+            invitations.append({
+                'source': source,
+                'invitation_id': invitation.id,
+                'sender_id': sender.id,
+                'sender_name': sender.username,
+                'sender_avatar': sender.avatar_url
+            })
+    
+    # Présence des contacts ayant changé depuis le curseur (tenue en mémoire)
+    presence_list = []
+    for contact_id in contact_graph.contacts_of(user_id):
+        last_seen = presence.last_seen(contact_id)
+        if changed_since is not None and (last_seen is None or last_seen <= changed_since):
+            continue
+        presence_list.append({
+            'user_id': contact_id,
+            'is_online': presence.is_online(contact_id),
+            'last_seen': last_seen.strftime('%H:%M') if last_seen else '',
+            'last_seen_formatted': format_last_seen(last_seen)
         })
     
-    return jsonify({'messages': messages_list})
+    return jsonify({
+        'messages': [message_payload(msg) for msg in messages],
+        'conversations': conversation_list,
+        'invitations': invitations,
+        'presence': presence_list,
+        'has_more': has_more,
+        # Page incomplète : garder la date du curseur pour la page suivante
+        'cursor': (f"{changed_since.isoformat()}_{last_message_id}" if has_more
+                   else encode_sync_cursor(started_at, last_message_id))
+    })
+
+def highlight_snippet(snippet):
+    """Extrait de recherche en HTML : texte échappé, termes trouvés entre <mark>"""
+    return str(escape(snippet)).replace(
+        message_search.HIGHLIGHT_START, '<mark>'
+    ).replace(message_search.HIGHLIGHT_END, '</mark>')
+
+@app.route('/api/search_messages')
+@login_required
+def search_messages():
+    """
+    Recherche plein texte dans les conversations de l'utilisateur (FTS5),
+    du plus pertinent au moins pertinent par fenêtres de correspondances récentes,
+    paginée par curseur (voir message_search.search).
+    `q` : mots recherchés (le dernier en préfixe), `contact_id` : une seule conversation.
+    """
+    query = request.args.get('q', '')
+    contact_id = request.args.get('contact_id', type=int)
+    limit = max(1, min(request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int) or 1,
+                       app.config['MESSAGES_MAX_PAGE_SIZE']))
+    after = request.args.get('after')
+    if after:
+        try:
+            after = message_search.decode_cursor(after)
+        except ValueError:
+            return jsonify({'error': 'Curseur invalide'}), 400
+    
+    # Lecture seule : sur le pool de lecture en mode production
+    with db.engines.get(sqlite_tuning.READER_BIND, db.engine).connect() as connection:
+        results, next_after = message_search.search(
+            connection, current_user.id, query, contact_id=contact_id, limit=limit, after=after
+        )
+    
+    return jsonify({
+        'results': [{
+            'message_id': result['id'],
+            'contact_id': result['receiver_id'] if result['sender_id'] == current_user.id else result['sender_id'],
+            'sender_id': result['sender_id'],
+            'message_type': result['message_type'],
+            'snippet': highlight_snippet(result['snippet']),
+            'timestamp': result['timestamp'].strftime('%d/%m/%Y %H:%M') if result['timestamp'] else ''
+        } for result in results],
+        'has_more': next_after is not None,
+        'next_cursor': message_search.encode_cursor(next_after) if next_after else None
+    })
 
 @app.route('/send_message', methods=['POST'])
 @login_required
@@ -1058,29 +1955,29 @@ def send_message():
     
     receiver_lang = receiver.language
     
-    translated_content = content
-    if sender_lang != receiver_lang:
-        translated_content = translation_service.translate_message(
-            content, sender_lang, receiver_lang
-        )
+    # Langue réelle du message, détectée localement (sans appel réseau)
+    source_lang = translation_service.detect_language(content, default=sender_lang, allow_backend=False)
+    
+    # La traduction est faite en arrière-plan pour ne pas retarder l'envoi
+    translation_pending = source_lang != receiver_lang and classify_text(content) == 'text'
+    translated_content = None if translation_pending else content
     
     message = Message(
         sender_id=current_user.id,
         receiver_id=receiver_id,
         content=content,
         translated_content=translated_content,
-        original_language=sender_lang,
+        original_language=source_lang,
         translated_language=receiver_lang,
         message_type=message_type,
-        is_delivered=True,
         timestamp=datetime.utcnow()
     )
     
-    db.session.add(message)
-    db.session.commit()
+    save_message(message)
     
     socketio.emit('new_message', {
         'message_id': message.id,
+        'seq': message.seq,
         'sender_id': current_user.id,
         'receiver_id': receiver_id,
         'content': content,
@@ -1089,13 +1986,19 @@ def send_message():
         'sender_name': current_user.username,
         'sender_avatar': current_user.avatar_url,
         'sender_language': sender_lang,
-        'receiver_language': receiver_lang
+        'receiver_language': receiver_lang,
+        'translation_pending': translation_pending
     }, room=f'user_{receiver_id}')
     
+    if translation_pending:
+        queue_message_translation(message.id, content, source_lang, receiver_lang, current_user.id, receiver_id)
+    
     return jsonify({
         'success': True,
         'message_id': message.id,
-        'translated_content': translated_content
+        'seq': message.seq,
+        'translated_content': translated_content,
+        'translation_pending': translation_pending
     })
 
 @app.route('/send_message_direct', methods=['POST'])
@@ -1111,30 +2014,38 @@ def send_message_direct():
     if not receiver:
         return jsonify({'success': False, 'message': 'Utilisateur non trouvé'})
     
+    translation_pending = current_user.language != receiver.language and classify_text(content or '') == 'text'
+    
     message = Message(
         sender_id=current_user.id,
         receiver_id=receiver_id,
         content=content,
+        translated_content=None if translation_pending else content,
+        original_language=current_user.language,
+        translated_language=receiver.language,
         message_type=message_type,
         is_read=False,
         timestamp=datetime.utcnow()
     )
-    db.session.add(message)
-    db.session.commit()
-    
-    translated_content = translate_text(content, receiver.language)
+    save_message(message)
     
     emit_new_message(receiver_id, {
         'id': message.id,
+        'message_id': message.id,
+        'seq': message.seq,
         'sender_id': current_user.id,
         'sender_name': current_user.username,
         'sender_avatar': current_user.avatar_url,
         'content': content,
-        'translated_content': translated_content,
+        'translated_content': message.translated_content,
+        'translation_pending': translation_pending,
         'timestamp': message.timestamp.strftime('%H:%M'),
         'message_type': message_type
     })
     
+    if translation_pending:
+        queue_message_translation(message.id, content, current_user.language, receiver.language, current_user.id, receiver_id)
+    
     return jsonify({'success': True, 'message_id': message.id})
 
 # =============== ROUTES POUR LES FICHIERS ===============
@@ -1184,11 +2095,11 @@ def upload_file():
             timestamp=datetime.utcnow()
         )
         
-        db.session.add(file_message)
-        db.session.commit()
+        save_message(file_message)
         
         socketio.emit('new_file_message', {
             'message_id': file_message.id,
+            'seq': file_message.seq,
             'sender_id': current_user.id,
             'receiver_id': receiver_id,
             'filename': original_filename,
@@ -1203,6 +2114,7 @@ def upload_file():
         return jsonify({
             'success': True,
             'message_id': file_message.id,
+            'seq': file_message.seq,
             'filename': original_filename,
             'file_url': file_url,
             'file_type': file_type,
@@ -1267,11 +2179,11 @@ def upload_multiple_files():
             timestamp=datetime.utcnow()
         )
         
-        db.session.add(file_message)
-        db.session.commit()
+        save_message(file_message)
         
         socketio.emit('new_multiple_files', {
             'message_id': file_message.id,
+            'seq': file_message.seq,
             'sender_id': current_user.id,
             'receiver_id': receiver_id,
             'files': uploaded_files,
@@ -1283,6 +2195,7 @@ def upload_multiple_files():
         return jsonify({
             'success': True,
             'message_id': file_message.id,
+            'seq': file_message.seq,
             'files': uploaded_files,
             'count': len(uploaded_files)
         })
@@ -1331,11 +2244,11 @@ def send_voice_message():
             timestamp=datetime.utcnow()
         )
         
-        db.session.add(voice_message)
-        db.session.commit()
+        save_message(voice_message)
         
         socketio.emit('new_voice_message', {
             'message_id': voice_message.id,
+            'seq': voice_message.seq,
             'sender_id': current_user.id,
             'receiver_id': receiver_id,
             'file_url': file_url,
@@ -1348,6 +2261,7 @@ def send_voice_message():
         return jsonify({
             'success': True,
             'message_id': voice_message.id,
+            'seq': voice_message.seq,
             'file_url': file_url,
             'duration': duration,
             'file_size': file_size
@@ -1372,12 +2286,12 @@ def download_file(file_url):
 def get_file_stats():
     sent_files = Message.query.filter(
         Message.sender_id == current_user.id,
-        Message.message_type.in_(['file', 'multiple_files', 'voice'])
+        Message.message_type.in_(FILE_MESSAGE_TYPES)
     ).count()
     
     received_files = Message.query.filter(
         Message.receiver_id == current_user.id,
-        Message.message_type.in_(['file', 'multiple_files', 'voice'])
+        Message.message_type.in_(FILE_MESSAGE_TYPES)
     ).count()
     
     total_size = db.session.query(db.func.sum(Message.file_size)).filter(
@@ -1422,11 +2336,11 @@ def send_location():
         timestamp=datetime.utcnow()
     )
     
-    db.session.add(location_message)
-    db.session.commit()
+    save_message(location_message)
     
     socketio.emit('new_location_message', {
         'message_id': location_message.id,
+        'seq': location_message.seq,
         'sender_id': current_user.id,
         'receiver_id': receiver_id,
         'latitude': latitude,
@@ -1468,11 +2382,11 @@ def share_contact():
         timestamp=datetime.utcnow()
     )
     
-    db.session.add(contact_message)
-    db.session.commit()
+    save_message(contact_message)
     
     socketio.emit('new_contact_message', {
         'message_id': contact_message.id,
+        'seq': contact_message.seq,
         'sender_id': current_user.id,
         'receiver_id': receiver_id,
         'contact_info': contact_data,
@@ -1562,6 +2476,7 @@ def accept_invitation():
     db.session.add(contact1)
     db.session.add(contact2)
     db.session.commit()
+    contact_graph.invalidate(invitation.sender_id, invitation.receiver_id)
     
     emit_invitation_accepted(invitation.sender_id, {
         'username': current_user.username,
@@ -1632,9 +2547,27 @@ def upload_avatar():
 def translate_text_api():
     data = request.get_json()
     text = data.get('text')
+    texts = data.get('texts')
     from_lang = data.get('from_lang', current_user.language)
     to_lang = data.get('to_lang')
     
+    # Traduction par lot : {"texts": [...], "to_lang": "en"}
+    if texts is not None:
+        if not isinstance(texts, list) or not to_lang:
+            return jsonify({'error': 'Liste de textes ou langue de destination manquante'}), 400
+        
+        if len(texts) > app.config['MAX_BATCH_TRANSLATIONS']:
+            return jsonify({'error': f"Maximum {app.config['MAX_BATCH_TRANSLATIONS']} textes par requête"}), 400
+        
+        translations = translation_service.translate_batch(texts, from_lang, to_lang)
+        
+        return jsonify({
+            'originals': texts,
+            'translations': translations,
+            'from_lang': from_lang,
+            'to_lang': to_lang
+        })
+    
     if not text or not to_lang:
         return jsonify({'error': 'Texte ou langue de destination manquant'}), 400
     
@@ -1647,6 +2580,11 @@ def translate_text_api():
         'to_lang': to_lang
     })
 
+@app.route('/api/translation_stats')
+@login_required
+def get_translation_stats():
+    return jsonify(translation_service.get_translation_stats())
+
 @app.route('/api/languages')
 def get_languages():
     return jsonify(app.config['SUPPORTED_LANGUAGES'])
@@ -1658,6 +2596,7 @@ def get_contact_info(contact_id):
     
     if not contact_user:
         return jsonify({'error': 'Contact non trouvé'}), 404
+    apply_presence([contact_user])
     
     return jsonify({
         'id': contact_user.id,
@@ -1679,18 +2618,15 @@ def get_contact_info(contact_id):
 @app.route('/api/chat_stats')
 @login_required
 def get_chat_stats():
-    total_messages = Message.query.filter(
-        (Message.sender_id == current_user.id) | (Message.receiver_id == current_user.id)
-    ).count()
+    total_messages, last_message_at = user_conversations(current_user.id).with_entities(
+        db.func.coalesce(db.func.sum(Conversation.message_count), 0),
+        db.func.max(Conversation.last_message_at)
+    ).one()
     
-    total_contacts = Contact.query.filter_by(user_id=current_user.id).count()
+    total_contacts = len(contact_graph.contacts_of(current_user.id))
     total_groups = GroupMember.query.filter_by(user_id=current_user.id).count()
     
-    last_message = Message.query.filter(
-        (Message.sender_id == current_user.id) | (Message.receiver_id == current_user.id)
-    ).order_by(Message.timestamp.desc()).first()
-    
-    last_message_time = last_message.timestamp.strftime('%d/%m/%Y %H:%M') if last_message else 'Jamais'
+    last_message_time = last_message_at.strftime('%d/%m/%Y %H:%M') if last_message_at else 'Jamais'
     
     return jsonify({
         'total_messages': total_messages,
@@ -1704,41 +2640,29 @@ def get_chat_stats():
 @app.route('/api/unread_messages')
 @login_required
 def get_unread_messages():
-    contacts = Contact.query.filter_by(user_id=current_user.id).all()
-    
     unread_counts = {}
-    for contact in contacts:
-        unread_count = Message.query.filter(
-            Message.sender_id == contact.contact_id,
-            Message.receiver_id == current_user.id,
-            Message.is_read == False
-        ).count()
+    for conversation in user_conversations(current_user.id).all():
+        unread_count = conversation.unread_for(current_user.id)
         
         if unread_count > 0:
-            unread_counts[str(contact.contact_id)] = unread_count
+            unread_counts[str(conversation.other_user_id(current_user.id))] = unread_count
     
     return jsonify(unread_counts)
 
 @app.route('/api/mark_as_read/<int:contact_id>', methods=['POST'])
 @login_required
 def mark_as_read(contact_id):
-    messages = Message.query.filter(
-        Message.sender_id == contact_id,
-        Message.receiver_id == current_user.id,
-        Message.is_read == False
-    ).all()
-    
-    for message in messages:
-        message.is_read = True
-    
+    last_read_id = advance_read_watermark(current_user.id, contact_id)
     db.session.commit()
     
-    socketio.emit('messages_read', {
-        'contact_id': contact_id,
-        'user_id': current_user.id
-    }, room=f'user_{contact_id}')
+    if last_read_id is not None:
+        socketio.emit('messages_read', {
+            'contact_id': contact_id,
+            'user_id': current_user.id,
+            'last_read_id': last_read_id
+        }, room=f'user_{contact_id}')
     
-    return jsonify({'success': True, 'count': len(messages)})
+    return jsonify({'success': True, 'last_read_id': last_read_id})
 
 @app.route('/api/omni', methods=['POST'])
 @login_required
@@ -1821,7 +2745,14 @@ def health_check():
         'status': 'OK',
         'timestamp': datetime.utcnow().isoformat(),
         'users_count': User.query.count(),
-        'messages_count': Message.query.count()
+        'messages_count': Message.query.count(),
+        'message_writer': message_writer.stats() if message_writer else None,
+        'presence': presence.stats(),
+        'contact_graph': contact_graph.stats(),
+        'socket_events': {
+            'coalescer': event_coalescer.stats(),
+            'relay_limiter': relay_limiter.stats()
+        }
     })
 
 # =============== SOCKETIO HANDLERS ===============
@@ -1830,57 +2761,127 @@ def health_check():
 def handle_connect():
     if current_user.is_authenticated:
         join_room(f'user_{current_user.id}')
-        current_user.is_online = True
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
         
-        contacts = Contact.query.filter_by(user_id=current_user.id).all()
-        for contact in contacts:
-            emit('user_status', {
-                'user_id': current_user.id,
-                'is_online': True,
-                'status': current_user.status,
-                'last_seen': current_user.last_seen.strftime('%H:%M')
-            }, room=f'user_{contact.contact_id}')
+        # Messages reçus hors ligne : première trame, la suite après chaque accusé
+        send_delivery_frame(current_user.id)
+        
+        # Seul le premier onglet ouvert annonce le passage en ligne
+        if not presence.connect(current_user.id, request.sid):
+            return
+        
+        last_seen = presence.last_seen(current_user.id)
+        emit_to_watchers(current_user.id, 'user_status', {
+            'user_id': current_user.id,
+            'is_online': True,
+            'status': current_user.status,
+            'last_seen': last_seen.strftime('%H:%M')
+        })
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    relay_limiter.forget(request.sid)
     if current_user.is_authenticated:
-        current_user.is_online = False
-        current_user.last_seen = datetime.utcnow()
+        # Hors ligne seulement quand le dernier onglet se ferme
+        if not presence.disconnect(current_user.id, request.sid):
+            return
+        
+        last_seen = presence.last_seen(current_user.id)
+        emit_to_watchers(current_user.id, 'user_status', {
+            'user_id': current_user.id,
+            'is_online': False,
+            'last_seen': last_seen.strftime('%H:%M'),
+            'last_seen_formatted': format_last_seen(last_seen)
+        })
+
+def send_delivery_frame(user_id, after_id=0):
+    """Envoie à la connexion courante une trame de messages non distribués ; retourne sa taille"""
+    limit = app.config['DELIVERY_BATCH_SIZE']
+    messages = undelivered_messages(user_id, after_id).limit(limit + 1).all()
+    if not messages:
+        return 0
+    
+    emit('message_backlog', {
+        'messages': [message_payload(msg) for msg in messages[:limit]],
+        'has_more': len(messages) > limit
+    })
+    return min(len(messages), limit)
+
+@socketio.on('messages_delivered')
+def handle_messages_delivered(data):
+    """Accusé de réception du client : marque les messages distribués, puis envoie la trame suivante"""
+    if not current_user.is_authenticated:
+        return
+    if not isinstance(data, dict):
+        data = {}
+    try:
+        message_ids = [int(message_id) for message_id in data.get('message_ids') or []]
+    except (TypeError, ValueError):
+        return
+    message_ids = message_ids[:app.config['DELIVERY_BATCH_SIZE']]
+    
+    if message_ids:
+        rows = db.session.execute(
+            db.update(Message)
+            .where(Message.receiver_id == current_user.id,
+                   Message.id.in_(message_ids),
+                   Message.is_delivered == db.false())
+            .values(is_delivered=True)
+            .returning(Message.id, Message.sender_id)
+            .execution_options(synchronize_session=False)
+        ).all()
         db.session.commit()
         
-        contacts = Contact.query.filter_by(user_id=current_user.id).all()
-        for contact in contacts:
-            emit('user_status', {
-                'user_id': current_user.id,
-                'is_online': False,
-                'last_seen': current_user.last_seen.strftime('%H:%M'),
-                'last_seen_formatted': format_last_seen(current_user.last_seen)
-            }, room=f'user_{contact.contact_id}')
+        # Un accusé de distribution par expéditeur
+        delivered = {}
+        for message_id, sender_id in rows:
+            delivered.setdefault(sender_id, []).append(message_id)
+        for sender_id, ids in delivered.items():
+            socketio.emit('message_delivered', {
+                'receiver_id': current_user.id,
+                'message_ids': ids
+            }, room=f'user_{sender_id}')
+    
+    if data.get('has_more'):
+        send_delivery_frame(current_user.id, max(message_ids, default=0))
 
 @socketio.on('typing')
 def handle_typing(data):
     receiver_id = data.get('receiver_id')
-    is_typing = data.get('is_typing')
+    is_typing = bool(data.get('is_typing'))
     
-    emit('typing_status', {
+    relay_ephemeral(receiver_id, 'typing_status', {
         'user_id': current_user.id,
         'is_typing': is_typing
-    }, room=f'user_{receiver_id}')
+    }, state=is_typing)
 
 @socketio.on('read_message')
 def handle_read_message(data):
-    message_id = data.get('message_id')
-    message = Message.query.get(message_id)
+    if not isinstance(data, dict):
+        return
+    try:
+        message_id = int(data.get('message_id'))
+        contact_id = int(data['contact_id']) if data.get('contact_id') is not None else None
+    except (TypeError, ValueError):
+        return
+    
+    # Seul le destinataire fait avancer son filigrane, et seulement dans la conversation du message
+    # (contact_id absent : ancien format, l'expéditeur est retrouvé depuis le message)
+    message = db.session.get(Message, message_id)
+    if not message or message.receiver_id != current_user.id:
+        return
+    if contact_id is not None and message.sender_id != contact_id:
+        return
+    contact_id = message.sender_id
+    
+    last_read_id = advance_read_watermark(current_user.id, contact_id, message_id)
+    db.session.commit()
     
-    if message and message.receiver_id == current_user.id:
-        message.is_read = True
-        db.session.commit()
-        
+    if last_read_id is not None:
         emit('message_read', {
-            'message_id': message_id
-        }, room=f'user_{message.sender_id}')
+            'message_id': message_id,
+            'user_id': current_user.id,
+            'last_read_id': last_read_id
+        }, room=f'user_{contact_id}')
 
 @socketio.on('file_upload_progress')
 def handle_file_upload_progress(data):
@@ -1888,17 +2889,66 @@ def handle_file_upload_progress(data):
     progress = data.get('progress')
     filename = data.get('filename')
     
-    emit('upload_progress', {
+    # Un flux par fichier : la progression d'un fichier ne fusionne pas avec celle d'un autre
+    relay_ephemeral(receiver_id, 'upload_progress', {
         'sender_id': current_user.id,
         'filename': filename,
         'progress': progress
-    }, room=f'user_{receiver_id}')
+    }, state=progress, stream=filename)
 
 # =============== FONCTION DE CRÉATION DES TABLES ===============
 
+def create_missing_indexes():
+    """Crée les index déclarés sur les modèles qui manquent dans une base existante"""
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+def create_delivery_queue():
+    """
+    À appeler avant create_missing_indexes : sur une base antérieure à la file de
+    distribution (index absent), marque l'historique existant comme distribué,
+    is_delivered n'ayant jusque-là presque jamais été renseigné.
+    """
+    existing = {index['name'] for index in db.inspect(db.engine).get_indexes('message')}
+    if 'ix_message_undelivered' in existing:
+        return 0
+    count = db.session.execute(
+        db.update(Message).where(Message.is_delivered.isnot(True)).values(is_delivered=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
 def create_tables():
     with app.app_context():
         db.create_all()
+        create_delivery_queue()
+        create_missing_indexes()
+        
+        # Index de recherche plein texte : créé et rempli au premier démarrage
+        with db.engine.begin() as connection:
+            if message_search.install(connection):
+                message_search.rebuild(connection)
+            # Index des utilisateurs : idem (rempli depuis la table user)
+            if user_search.install(connection):
+                user_search.rebuild(connection)
+        
+        # La présence repart de zéro avec le processus
+        User.query.filter(User.is_online == True).update({User.is_online: False})
+        db.session.commit()
+        
+        # Résumés de conversation absents (base antérieure) : les reconstruire
+        if not Conversation.query.first() and Message.query.first():
+            rebuild_conversations()
         
         if not User.query.filter_by(username='admin').first():
             admin = User(
@@ -1918,6 +2968,8 @@ def create_tables():
 
 if __name__ == '__main__':
     create_tables()
+    sqlite_tuning.start_checkpointer(app, spawn=socketio.start_background_task, sleep=socketio.sleep)
+    presence.start_flusher(write_presence, spawn=socketio.start_background_task, sleep=socketio.sleep)
     print("=" * 50)
     print("MBAJO 7.0 - MISPA Messenger")
     print("=" * 50)
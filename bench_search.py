@@ -0,0 +1,116 @@
+# bench_search.py
+# Latence de /api/search_messages (message_search.py) sur un corpus synthétique
+# Lancer avec : python bench_search.py [--rows 2000000] [--users 2000] [--queries 200]
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+import message_search
+from sqlite_tuning import tune_engine
+
+SCHEMA = """CREATE TABLE message (
+    id INTEGER PRIMARY KEY,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    translated_content TEXT,
+    timestamp DATETIME,
+    message_type VARCHAR(20) DEFAULT 'text'
+)"""
+
+INSERT = text("""INSERT INTO message (sender_id, receiver_id, content, translated_content, timestamp)
+                 VALUES (:s, :r, :c, :t, :ts)""")
+
+COMMON_WORDS = ['bonjour', 'merci', 'demain', 'réunion', 'oui', 'non', 'photo', 'appel', 'soir', 'travail',
+                'hello', 'thanks', 'tomorrow', 'meeting', 'call', 'tonight', 'work', 'maison', 'famille', 'été']
+
+
+def vocabulary(size):
+    """Mots courants + mots synthétiques (distribution de Zipf approchée par les poids)"""
+    syllables = ['ba', 'ko', 'mi', 'ra', 'tu', 'le', 'no', 'si', 'da', 'pe', 'zo', 'fi', 'gu', 'va']
+    words = list(COMMON_WORDS)
+    while len(words) < size:
+        words.append(''.join(random.choice(syllables) for _ in range(random.randint(2, 4))))
+    cumulative, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    return words, cumulative
+
+
+def create_database(path, users, rows, words, cumulative):
+    engine = create_engine(f'sqlite:///{path}')
+    started = time.monotonic()
+    start_date = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(text(SCHEMA))
+        for chunk in range(0, rows, 50000):
+            batch = []
+            for i in range(chunk, min(rows, chunk + 50000)):
+                sender = random.randint(1, users)
+                receiver = random.randint(1, users)
+                content = ' '.join(random.choices(words, cum_weights=cumulative, k=random.randint(3, 15)))
+                batch.append({'s': sender, 'r': receiver, 'c': content,
+                              't': content if i % 3 else None,
+                              'ts': start_date + timedelta(seconds=i)})
+            connection.execute(INSERT, batch)
+    loaded = time.monotonic()
+    with engine.begin() as connection:
+        message_search.install(connection)
+        message_search.rebuild(connection)
+    print(f"📦 {rows} messages chargés en {loaded - started:.1f}s, index FTS5 construit en "
+          f"{time.monotonic() - loaded:.1f}s ({os.path.getsize(path) / 1024 / 1024:.0f} Mo)")
+    engine.dispose()
+
+
+def measure(engine, name, users, queries, make_query, pages=1):
+    durations = []
+    with engine.connect() as connection:
+        for _ in range(queries):
+            user_id = random.randint(1, users)
+            query = make_query()
+            started = time.perf_counter()
+            after = None
+            for _ in range(pages):
+                results, after = message_search.search(connection, user_id, query, after=after)
+                if after is None:
+                    break
+            durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    p50 = durations[len(durations) // 2]
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{name:<28} p50: {p50:>7.2f} ms   p95: {p95:>7.2f} ms   max: {durations[-1]:>7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latence de la recherche plein texte des messages')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    words, cumulative = vocabulary(args.words)
+    path = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    create_database(path, args.users, args.rows, words, cumulative)
+
+    engine = tune_engine(create_engine(f'sqlite:///{path}'), read_only=True)
+    print(f"🔎 {args.queries} recherches par cas, {args.users} utilisateurs "
+          f"(~{2 * args.rows // args.users} messages chacun)")
+    measure(engine, 'mot courant', args.users, args.queries, lambda: random.choice(COMMON_WORDS[:5]))
+    measure(engine, 'mot rare', args.users, args.queries, lambda: random.choice(words[-1000:]))
+    measure(engine, 'préfixe (2 lettres)', args.users, args.queries, lambda: random.choice(words[20:200])[:2])
+    measure(engine, 'deux mots', args.users, args.queries,
+            lambda: ' '.join(random.sample(COMMON_WORDS, 2)) + ' ')
+    measure(engine, 'mot courant, 3 pages', args.users, args.queries,
+            lambda: random.choice(COMMON_WORDS[:5]), pages=3)
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
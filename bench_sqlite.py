@@ -0,0 +1,134 @@
+# bench_sqlite.py
+# Débit en lecture/écriture concurrentes : SQLite par défaut vs mode production (sqlite_tuning.py)
+# Lancer avec : python bench_sqlite.py [--writers 4] [--readers 16] [--duration 5]
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from sqlite_tuning import checkpoint, tune_engine
+
+SCHEMA = [
+    """CREATE TABLE message (
+        id INTEGER PRIMARY KEY,
+        sender_id INTEGER NOT NULL,
+        receiver_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        timestamp DATETIME,
+        is_read BOOLEAN DEFAULT 0
+    )""",
+    "CREATE INDEX ix_message_sender_receiver_timestamp ON message (sender_id, receiver_id, timestamp, id)",
+]
+
+INSERT = text("INSERT INTO message (sender_id, receiver_id, content, timestamp) VALUES (:s, :r, :c, :t)")
+PAGE = text("""
+    SELECT id, sender_id, content, timestamp FROM message
+    WHERE (sender_id = :a AND receiver_id = :b) OR (sender_id = :b AND receiver_id = :a)
+    ORDER BY timestamp DESC, id DESC LIMIT 50
+""")
+
+
+def create_database(path, users, rows):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(INSERT, [
+            {'s': random.randint(1, users), 'r': random.randint(1, users),
+             'c': f'message {i}', 't': datetime.utcnow()}
+            for i in range(rows)
+        ])
+    engine.dispose()
+
+
+def default_engines(path, readers):
+    """Configuration actuelle : journal rollback, un pool commun"""
+    engine = create_engine(f'sqlite:///{path}', pool_size=readers, max_overflow=readers)
+    return engine, engine
+
+
+def production_engines(path, readers):
+    """Mode production : WAL + pragmas, un écrivain, un pool de lecteurs"""
+    writer = tune_engine(create_engine(f'sqlite:///{path}', pool_size=1, max_overflow=0, pool_timeout=30))
+    reader = tune_engine(create_engine(f'sqlite:///{path}', pool_size=readers, max_overflow=0, pool_timeout=30),
+                         read_only=True)
+    with writer.connect():
+        pass
+    return writer, reader
+
+
+def run(profile, engines, args):
+    writer, reader = engines
+    stop = threading.Event()
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def write_loop():
+        while not stop.is_set():
+            a, b = random.randint(1, args.users), random.randint(1, args.users)
+            try:
+                with writer.begin() as connection:
+                    connection.execute(INSERT, {'s': a, 'r': b, 'c': 'bonjour', 't': datetime.utcnow()})
+                count('writes')
+            except OperationalError:
+                count('errors')
+
+    def read_loop():
+        while not stop.is_set():
+            a, b = random.randint(1, args.users), random.randint(1, args.users)
+            try:
+                with reader.connect() as connection:
+                    connection.execute(PAGE, {'a': a, 'b': b}).fetchall()
+                count('reads')
+            except OperationalError:
+                count('errors')
+
+    threads = [threading.Thread(target=write_loop) for _ in range(args.writers)]
+    threads += [threading.Thread(target=read_loop) for _ in range(args.readers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f"{profile:<12} écritures/s: {counts['writes'] / elapsed:>9.0f}   "
+          f"lectures/s: {counts['reads'] / elapsed:>9.0f}   erreurs: {counts['errors']}")
+    writer.dispose()
+    reader.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Débit SQLite : configuration par défaut vs mode production')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"🏁 {args.writers} écrivains, {args.readers} lecteurs, {args.duration:.0f}s par profil, "
+          f"{args.rows} messages initiaux")
+    directory = tempfile.mkdtemp()
+    for profile, build in (('défaut', default_engines), ('production', production_engines)):
+        path = os.path.join(directory, f'bench_{build.__name__}.db')
+        create_database(path, args.users, args.rows)
+        run(profile, build(path, args.readers), args)
+        if profile == 'production':
+            checkpoint(path, 'TRUNCATE')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# bench_user_search.py
+# Latence de /api/search_users (user_search.py) par frappe, sur une table user synthétique
+# Lancer avec : python bench_user_search.py [--users 1000000] [--queries 300]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+import user_search
+from sqlite_tuning import tune_engine
+
+SCHEMA = [
+    """CREATE TABLE user (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR(80) NOT NULL UNIQUE,
+        email VARCHAR(120) NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE user_search (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(80) NOT NULL,
+        email_local VARCHAR(120) NOT NULL
+    )""",
+    'CREATE INDEX ix_user_search_name ON user_search (name)',
+    'CREATE INDEX ix_user_search_email_local ON user_search (email_local)',
+]
+
+FIRST_NAMES = ['Éloïse', 'Jean', 'Marie', 'François', 'Amélie', 'Noël', 'José', 'Chloé', 'Hélène', 'Léo',
+               'Awa', 'Moussa', 'Fatou', 'Ibrahim', 'Anna', 'John', 'Maria', 'Ahmed', 'Sofía', 'Björn']
+LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Mbakam', 'Ndiaye', 'Diallo', 'García', 'Müller', 'Lefèvre', 'Smith',
+              'Traoré', 'Kouassi', 'Rossi', 'Nguyen', 'Fernández', 'Moreau', 'Girard', 'Tchoumi', 'Kamga', 'Ekwalla']
+DOMAINS = ['gmail.com', 'yahoo.fr', 'outlook.com', 'mispa.com']
+
+
+def create_database(path, users):
+    engine = create_engine(f'sqlite:///{path}')
+    started = time.monotonic()
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.execute(text(statement))
+        for chunk in range(1, users + 1, 50000):
+            batch = []
+            for user_id in range(chunk, min(users + 1, chunk + 50000)):
+                first, last = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+                batch.append({'id': user_id, 'username': f'{first}{last}{user_id}',
+                              'email': f'{first.lower()}.{last.lower()}{user_id}@{random.choice(DOMAINS)}'})
+            connection.execute(text('INSERT INTO user (id, username, email) VALUES (:id, :username, :email)'), batch)
+    loaded = time.monotonic()
+    with engine.begin() as connection:
+        user_search.install(connection)
+        user_search.rebuild(connection)
+    print(f"📦 {users} utilisateurs chargés en {loaded - started:.1f}s, index construit en "
+          f"{time.monotonic() - loaded:.1f}s ({os.path.getsize(path) / 1024 / 1024:.0f} Mo)")
+    engine.dispose()
+
+
+def measure(engine, name, users, queries, make_query):
+    durations = []
+    with engine.connect() as connection:
+        for _ in range(queries):
+            contact_ids = set(random.sample(range(1, users + 1), 200))
+            query = make_query()
+            started = time.perf_counter()
+            user_search.search(connection, query, exclude_id=1, contact_ids=contact_ids)
+            durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    p50 = durations[len(durations) // 2]
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"{name:<28} p50: {p50:>7.2f} ms   p95: {p95:>7.2f} ms   max: {durations[-1]:>7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latence de la recherche des utilisateurs')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_user_search.db')
+    create_database(path, args.users)
+
+    engine = tune_engine(create_engine(f'sqlite:///{path}'), read_only=True)
+    print(f"🔎 {args.queries} recherches par cas, 200 contacts par utilisateur")
+    measure(engine, 'préfixe (2 lettres)', args.users, args.queries,
+            lambda: random.choice(FIRST_NAMES)[:2])
+    measure(engine, 'prénom (frappe)', args.users, args.queries,
+            lambda: random.choice(FIRST_NAMES)[:random.randint(3, 6)])
+    measure(engine, 'nom de famille (sous-chaîne)', args.users, args.queries,
+            lambda: random.choice(LAST_NAMES)[:random.randint(3, 7)])
+    measure(engine, 'prénom + nom', args.users, args.queries,
+            lambda: random.choice(FIRST_NAMES) + random.choice(LAST_NAMES)[:3])
+    measure(engine, 'numéro (rare)', args.users, args.queries,
+            lambda: str(random.randint(10000, args.users)))
+    measure(engine, 'aucun résultat', args.users, args.queries,
+            lambda: 'qxw' + random.choice('abcdef'))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
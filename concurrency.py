@@ -0,0 +1,95 @@
+import threading
+import time
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+
+def in_green_thread():
+    """Indique si l'appelant est un green thread (eventlet) plutôt qu'un thread système"""
+    if greenlet is None:
+        return False
+    return greenlet.getcurrent().parent is not None
+
+
+def wait_event(event, timeout=None, poll_interval=0.005):
+    """Attend un threading.Event sans bloquer le hub eventlet
+
+    Un thread système attend normalement. Un green thread rend la main au
+    hub entre deux vérifications pour que les autres green threads (dont
+    celui qui doit signaler l'événement) continuent à tourner.
+    """
+    if not in_green_thread():
+        return event.wait(timeout)
+
+    import eventlet
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not event.is_set():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        eventlet.sleep(poll_interval)
+    return True
+
+
+class _Call:
+    """Appel en cours partagé par plusieurs demandeurs"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Regroupe les appels identiques simultanés en un seul
+
+    Le premier appelant pour une clé exécute la fonction ; les suivants
+    attendent son résultat (ou son exception) au lieu de refaire l'appel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Exécute fn() une seule fois pour toutes les demandes simultanées sur key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            wait_event(call.done)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Retourne le nombre d'appels exécutés et d'appels économisés"""
+        return {
+            'in_flight': len(self._calls),
+            'executed': self.leaders,
+            'coalesced': self.coalesced
+        }
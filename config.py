@@ -7,9 +7,26 @@ class Config:
     
     # Base de données
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-    SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(BASE_DIR, "database", "mispa.db")}'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.join(BASE_DIR, "database", "mispa.db")}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Mode production SQLite (voir sqlite_tuning.py) : WAL, pragmas, un écrivain et un pool de lecteurs
+    SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '0') == '1'
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE') or 8)
+    SQLITE_READ_MAX_OVERFLOW = int(os.environ.get('SQLITE_READ_MAX_OVERFLOW') or 32)  # lecteurs en plus lors d'un pic
+    SQLITE_POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT') or 5)
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # millisecondes
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)  # octets
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -65536)  # négatif : en Kio
+    SQLITE_CHECKPOINT_INTERVAL = float(os.environ.get('SQLITE_CHECKPOINT_INTERVAL') or 60)  # secondes
+    
+    # Écriture groupée des messages (voir write_behind.py) : un commit pour plusieurs requêtes
+    # Durabilité : 'commit' (réponse après le commit du lot) ou 'flush' (dès l'id attribué, sans garantie)
+    MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', '0') == '1'
+    MESSAGE_WRITE_BEHIND_WINDOW_MS = float(os.environ.get('MESSAGE_WRITE_BEHIND_WINDOW_MS') or 2)
+    MESSAGE_WRITE_BEHIND_MAX_ROWS = int(os.environ.get('MESSAGE_WRITE_BEHIND_MAX_ROWS') or 64)
+    MESSAGE_WRITE_BEHIND_DURABILITY = os.environ.get('MESSAGE_WRITE_BEHIND_DURABILITY') or 'commit'
+    
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
@@ -37,6 +54,14 @@ class Config:
         'fa': 'فارسی'
     }
     
+    # Services de traduction, dans l'ordre de préférence ('stub' pour travailler hors ligne)
+    TRANSLATION_BACKENDS = os.environ.get('TRANSLATION_BACKENDS') or 'translatepy,deep-translator'
+    TRANSLATION_TIMEOUT = float(os.environ.get('TRANSLATION_TIMEOUT') or 5.0)
+    TRANSLATION_HEDGING = os.environ.get('TRANSLATION_HEDGING', '0') == '1'
+    
+    # Correspondances approchées dans la mémoire de traduction (ex: 0.92), désactivées par défaut
+    TRANSLATION_FUZZY_THRESHOLD = float(os.environ.get('TRANSLATION_FUZZY_THRESHOLD') or 0) or None
+    
     # Messages par défaut
     DEFAULT_MESSAGES = {
         'welcome': "Bienvenue sur MISPA - Messagerie Sans Frontières",
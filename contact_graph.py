@@ -0,0 +1,77 @@
+"""
+Cache du graphe des contacts
+
+Pour chaque utilisateur : l'ensemble (frozenset) de ses contacts et celui
+des utilisateurs qui l'ont dans leurs contacts (à prévenir de ses
+changements de statut). À invalider à chaque ajout/retrait de contact.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ContactGraph:
+    """Contacts et contacts inverses par utilisateur, en cache LRU
+
+    ``load_contacts(user_id)`` et ``load_watchers(user_id)`` retournent les
+    identifiants depuis la base lors d'un défaut de cache.
+    """
+
+    def __init__(self, load_contacts, load_watchers, max_users=10000):
+        self.load_contacts = load_contacts
+        self.load_watchers = load_watchers
+        self.max_users = max_users
+        self._contacts = OrderedDict()
+        self._watchers = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _get(self, cache, loader, user_id):
+        with self._lock:
+            ids = cache.get(user_id)
+            if ids is not None:
+                cache.move_to_end(user_id)
+                self.hits += 1
+                return ids
+            self.misses += 1
+
+        ids = frozenset(loader(user_id))
+        with self._lock:
+            cache[user_id] = ids
+            cache.move_to_end(user_id)
+            while len(cache) > self.max_users:
+                cache.popitem(last=False)
+        return ids
+
+    def contacts_of(self, user_id):
+        """Identifiants des contacts de user_id"""
+        return self._get(self._contacts, self.load_contacts, user_id)
+
+    def watchers_of(self, user_id):
+        """Identifiants des utilisateurs qui ont user_id dans leurs contacts"""
+        return self._get(self._watchers, self.load_watchers, user_id)
+
+    def invalidate(self, *user_ids):
+        """Oublie les entrées des utilisateurs dont les contacts ont changé"""
+        with self._lock:
+            for user_id in user_ids:
+                self._contacts.pop(user_id, None)
+                self._watchers.pop(user_id, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._contacts.clear()
+            self._watchers.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'users': len(self._contacts),
+            'reverse_users': len(self._watchers),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,176 @@
+"""
+Limitation des événements socket éphémères (saisie en cours, progression d'envoi)
+
+- EventCoalescer : par (expéditeur, destinataire, événement), ne relaie que
+  les changements d'état, au plus un événement par intervalle ; le dernier
+  état reçu pendant l'intervalle est envoyé à sa fin (rien n'est perdu,
+  les états intermédiaires sont fusionnés).
+- RelayLimiter : seau à jetons par connexion, appliqué aux seuls envois
+  immédiats (``allow`` de EventCoalescer.submit) : un événement refusé par
+  le seau est différé à la fin de l'intervalle, jamais perdu, pour que
+  l'état final d'un flux (fin de saisie, progression à 100) arrive toujours.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Seau à jetons : ``rate`` jetons par seconde, au plus ``burst`` d'avance"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RelayLimiter:
+    """Un seau à jetons par connexion socket"""
+
+    def __init__(self, rate=10.0, burst=20):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.dropped = 0
+
+    def allow(self, sid):
+        with self._lock:
+            bucket = self._buckets.get(sid)
+            if bucket is None:
+                bucket = self._buckets[sid] = TokenBucket(self.rate, self.burst)
+            if bucket.allow():
+                self.allowed += 1
+                return True
+            self.dropped += 1
+            return False
+
+    def forget(self, sid):
+        """À appeler à la déconnexion"""
+        with self._lock:
+            self._buckets.pop(sid, None)
+
+    def stats(self):
+        return {'connections': len(self._buckets), 'allowed': self.allowed, 'dropped': self.dropped}
+
+
+class _Stream:
+    """État d'un flux (expéditeur, destinataire, événement)"""
+
+    __slots__ = ('last_state', 'last_sent', 'pending', 'scheduled')
+
+    def __init__(self):
+        self.last_state = None
+        self.last_sent = 0.0
+        self.pending = None
+        self.scheduled = False
+
+
+class EventCoalescer:
+    """Relaie les changements d'état, au plus un événement par ``interval`` secondes
+
+    ``emit(event, payload, room)`` envoie l'événement ; ``spawn(fn)`` et
+    ``sleep(seconds)`` servent à programmer l'envoi différé.
+    """
+
+    def __init__(self, emit, interval=0.25, spawn=None, sleep=time.sleep, idle_timeout=60.0):
+        self.emit = emit
+        self.interval = interval
+        self.spawn = spawn or (lambda fn: threading.Thread(target=fn, daemon=True).start())
+        self.sleep = sleep
+        self.idle_timeout = idle_timeout
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._submitted_since_prune = 0
+        self.received = 0
+        self.forwarded = 0
+        self.merged = 0
+        self.duplicates = 0
+
+    def submit(self, key, state, event, payload, room, allow=None):
+        """Propose un événement ; retourne True s'il est envoyé immédiatement
+
+        ``allow()`` (facultatif) autorise l'envoi immédiat ; s'il refuse,
+        l'événement part à la fin de l'intervalle comme un état fusionné.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.received += 1
+            self._maybe_prune(now)
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = self._streams[key] = _Stream()
+
+            if stream.pending is None and state == stream.last_state:
+                self.duplicates += 1
+                return False
+
+            due = now - stream.last_sent >= self.interval and stream.pending is None
+            if due and (allow is None or allow()):
+                stream.last_state = state
+                stream.last_sent = now
+                self.forwarded += 1
+                send_now = True
+            else:
+                if stream.pending is not None:
+                    self.merged += 1
+                stream.pending = (state, event, payload, room)
+                send_now = False
+                if not stream.scheduled:
+                    stream.scheduled = True
+                    # Envoi immédiat refusé par allow() : différé d'un intervalle complet
+                    delay = self.interval if due else max(0.0, stream.last_sent + self.interval - now)
+                    self.spawn(lambda: self._flush_later(key, delay))
+
+        if send_now:
+            self.emit(event, payload, room)
+        return send_now
+
+    def _flush_later(self, key, delay):
+        self.sleep(delay)
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                return
+            stream.scheduled = False
+            pending, stream.pending = stream.pending, None
+            if pending is None:
+                return
+            state, event, payload, room = pending
+            if state == stream.last_state:
+                # Revenu à l'état déjà annoncé pendant l'intervalle
+                self.merged += 1
+                return
+            stream.last_state = state
+            stream.last_sent = time.monotonic()
+            self.forwarded += 1
+        self.emit(event, payload, room)
+
+    def _maybe_prune(self, now):
+        """Oublie de temps en temps les flux inactifs (appelé sous verrou)"""
+        self._submitted_since_prune += 1
+        if self._submitted_since_prune < 1000:
+            return
+        self._submitted_since_prune = 0
+        for key in [key for key, stream in self._streams.items()
+                    if not stream.scheduled and now - stream.last_sent > self.idle_timeout]:
+            del self._streams[key]
+
+    def stats(self):
+        return {
+            'streams': len(self._streams),
+            'received': self.received,
+            'forwarded': self.forwarded,
+            'merged': self.merged,
+            'duplicates': self.duplicates
+        }
@@ -0,0 +1,103 @@
+import re
+import threading
+
+from translation_memory import TranslationCache
+
+try:
+    from langdetect import DetectorFactory, detect_langs
+    from langdetect.lang_detect_exception import LangDetectException
+
+    # Résultats reproductibles d'un appel à l'autre
+    DetectorFactory.seed = 0
+except ImportError:
+    detect_langs = None
+    LangDetectException = Exception
+
+# Codes langdetect à ramener aux codes utilisés par l'application
+LANGDETECT_ALIASES = {
+    'zh-cn': 'zh',
+    'zh-tw': 'zh',
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class LanguageDetector:
+    """Détection de langue locale (langdetect) avec cache
+
+    Le texte sans lettres (emoji, nombres, ponctuation) est résolu
+    immédiatement. Sinon langdetect est utilisé hors ligne ; le service
+    externe n'est appelé que si la confiance est trop faible et que
+    l'appelant l'autorise.
+    """
+
+    def __init__(self, backend=None, min_confidence=0.9, min_letters=12, cache_size=5000):
+        self.backend = backend
+        self.min_confidence = min_confidence
+        self.min_letters = min_letters
+        self.cache = TranslationCache(max_entries=cache_size)
+        self._lock = threading.Lock()
+        self.counters = {'heuristic': 0, 'cached': 0, 'local': 0, 'backend': 0, 'default': 0}
+
+    @staticmethod
+    def normalize(text):
+        """Clé de cache : minuscules et espaces normalisés"""
+        return _WHITESPACE_RE.sub(' ', text).strip().casefold()
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _detect_local(self, text):
+        """Retourne (langue, confiance) avec langdetect, ou (None, 0.0)"""
+        if detect_langs is None:
+            return None, 0.0
+        try:
+            best = detect_langs(text)[0]
+        except (LangDetectException, IndexError):
+            return None, 0.0
+        return LANGDETECT_ALIASES.get(best.lang, best.lang), best.prob
+
+    def detect(self, text, default='en', allow_backend=True):
+        """Détecte la langue d'un texte ou retourne default"""
+        if not text or not isinstance(text, str):
+            return default
+
+        letters = sum(1 for char in text if char.isalpha())
+        if letters == 0:
+            self._count('heuristic')
+            return default
+
+        key = self.normalize(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count('cached')
+            return cached
+
+        # Les textes très courts ne donnent pas de résultat fiable en local
+        language, confidence = (None, 0.0) if letters < self.min_letters else self._detect_local(text)
+        if language and confidence >= self.min_confidence:
+            self._count('local')
+            self.cache.set(key, language)
+            return language
+
+        if allow_backend and self.backend is not None:
+            try:
+                detected = self.backend(text)
+            except Exception as e:
+                print(f"Erreur de détection de langue: {e}")
+                detected = None
+            if detected:
+                self._count('backend')
+                self.cache.set(key, detected)
+                return detected
+
+        self._count('default')
+        return default
+
+    def stats(self):
+        """Retourne la répartition des détections par méthode"""
+        with self._lock:
+            counters = dict(self.counters)
+        counters['cache'] = self.cache.stats()
+        return counters
@@ -0,0 +1,233 @@
+"""
+Recherche plein texte dans les messages (SQLite FTS5)
+
+message_fts est un index FTS5 à contenu externe sur message.content et
+message.translated_content, tenu à jour par des triggers (toutes les
+écritures, ORM, lots groupés ou SQL brut, passent donc par lui).
+Chaque message y porte aussi ses participants ("u12 u34") : la recherche
+est limitée aux conversations de l'appelant par l'index lui-même, au lieu
+de filtrer après coup tous les messages correspondants de la base.
+
+Reconstruire l'index d'une base existante : python message_search.py
+"""
+import re
+
+from sqlalchemy import DateTime, text
+
+# Marqueurs de surlignage des extraits (remplacés après échappement HTML)
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Nombre maximal de mots pris en compte dans une recherche
+MAX_TERMS = 8
+
+# Longueurs des index de préfixes : FTS5 s'en sert pour chercher le dernier mot
+# saisi en préfixe, quelle que soit sa longueur (le mot n'est jamais tronqué,
+# "bonj" ne doit pas trouver "boite") ; en dessous de la plus courte, pas de préfixe
+PREFIX_LENGTHS = (2, 4, 6)
+
+# Correspondances classées ensemble : les résultats sont parcourus par fenêtres
+# des RANKING_WINDOW correspondances suivantes (des plus récentes aux plus
+# anciennes), classées par pertinence dans chaque fenêtre. bm25() est écarté :
+# il compte les documents de chaque terme sur toute la base, à chaque requête
+RANKING_WINDOW = 500
+
+# Longueur moyenne d'un message (en mots), pour normaliser le score
+AVERAGE_LENGTH = 12
+
+PARTICIPANTS = "'u' || {row}.sender_id || ' u' || {row}.receiver_id"
+
+SCHEMA = [
+    f"""CREATE VIEW IF NOT EXISTS message_search_source AS
+        SELECT id, content, translated_content, {PARTICIPANTS.format(row='message')} AS participants
+        FROM message""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content, translated_content, participants,
+        content='message_search_source', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 4 6'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts (rowid, content, translated_content, participants)
+        VALUES (new.id, new.content, new.translated_content, {PARTICIPANTS.format(row='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts (message_fts, rowid, content, translated_content, participants)
+        VALUES ('delete', old.id, old.content, old.translated_content, {PARTICIPANTS.format(row='old')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS message_fts_update
+        AFTER UPDATE OF content, translated_content, sender_id, receiver_id ON message BEGIN
+        INSERT INTO message_fts (message_fts, rowid, content, translated_content, participants)
+        VALUES ('delete', old.id, old.content, old.translated_content, {PARTICIPANTS.format(row='old')});
+        INSERT INTO message_fts (rowid, content, translated_content, participants)
+        VALUES (new.id, new.content, new.translated_content, {PARTICIPANTS.format(row='new')});
+    END""",
+]
+
+# Plus grand id possible : borne haute de la première fenêtre
+MAX_ID = 2 ** 63 - 1
+
+# Fenêtre classée : les correspondances d'ids compris entre :bottom et :top,
+# les plus récentes d'abord, avec le texte surligné
+SEARCH_WINDOW = """
+    SELECT message_fts.rowid AS id,
+           highlight(message_fts, 0, :start, :end) AS content,
+           highlight(message_fts, 1, :start, :end) AS translated_content,
+           message.sender_id, message.receiver_id, message.timestamp, message.message_type
+    FROM message_fts JOIN message ON message.id = message_fts.rowid
+    WHERE message_fts MATCH :query AND message_fts.rowid BETWEEN :bottom AND :top
+    ORDER BY message_fts.rowid DESC
+    LIMIT :window
+"""
+
+# Reste-t-il une correspondance d'id inférieur ou égal à :top ?
+SEARCH_BELOW = """
+    SELECT 1 FROM message_fts
+    WHERE message_fts MATCH :query AND rowid <= :top
+    LIMIT 1
+"""
+
+
+def install(connection):
+    """Crée l'index et ses triggers s'ils manquent ; retourne True si l'index vient d'être créé"""
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'")
+    ).first() is not None
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    return not exists
+
+
+def rebuild(connection):
+    """Reconstruit tout l'index à partir de la table message, puis le compacte"""
+    connection.execute(text("INSERT INTO message_fts (message_fts) VALUES ('rebuild')"))
+    connection.execute(text("INSERT INTO message_fts (message_fts) VALUES ('optimize')"))
+    return connection.execute(text('SELECT count(*) FROM message')).scalar()
+
+
+def match_expression(query, user_id, contact_id=None):
+    """
+    Requête FTS5 : les mots saisis dans le texte, limités aux conversations de
+    user_id. Le dernier mot est cherché en préfixe (recherche pendant la frappe)
+    sauf s'il est suivi d'une espace. Retourne None si la saisie ne contient aucun mot.
+    """
+    terms = re.findall(r'\w+', query or '')[:MAX_TERMS]
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    last = terms[-1]
+    if query == query.rstrip() and len(last) >= PREFIX_LENGTHS[0]:
+        phrases[-1] = f'"{last}"*'
+    expression = f'participants : "u{int(user_id)}"'
+    if contact_id is not None:
+        expression += f' AND participants : "u{int(contact_id)}"'
+    return f"{expression} AND {{content translated_content}} : ({' '.join(phrases)})"
+
+
+def score(highlighted):
+    """Pertinence façon BM25 sans IDF : occurrences trouvées, pondérées par la longueur du message"""
+    hits = highlighted.count(HIGHLIGHT_START)
+    length = len(re.findall(r'\w+', highlighted)) or 1
+    return round(hits * 2.2 / (hits + 1.2 * (0.25 + 0.75 * length / AVERAGE_LENGTH)), 6)
+
+
+def make_snippet(highlighted, before=4, after=8):
+    """Extrait de quelques mots autour de la première occurrence surlignée"""
+    words = highlighted.split()
+    first = next((i for i, word in enumerate(words) if HIGHLIGHT_START in word), 0)
+    start, end = max(0, first - before), min(len(words), first + after + 1)
+    snippet = ' '.join(words[start:end])
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(words) else '')
+
+
+def encode_cursor(cursor):
+    """Curseur (haut, bas, score, id) -> texte ; les valeurs absentes restent vides"""
+    return ':'.join('' if value is None else repr(value) for value in cursor)
+
+
+def decode_cursor(value):
+    """Texte -> curseur (haut, bas, score, id) ; lève ValueError s'il est invalide"""
+    top, bottom, score, message_id = value.split(':')
+    return (int(top), int(bottom) if bottom else None,
+            float(score) if score else None, int(message_id) if message_id else None)
+
+
+def _ranked_window(connection, expression, top, bottom):
+    """
+    Correspondances de la fenêtre, classées. bottom None : nouvelle fenêtre des
+    RANKING_WINDOW correspondances d'id <= top, dont le bas est alors fixé
+    (1 si elle est incomplète : plus rien en dessous). Retourne (résultats, haut, bas).
+    """
+    rows = connection.execute(text(SEARCH_WINDOW).columns(timestamp=DateTime), {
+        'query': expression, 'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END,
+        'top': top, 'bottom': bottom or 1, 'window': RANKING_WINDOW
+    }).all()
+    if bottom is None and rows:
+        top = rows[0].id
+        bottom = rows[-1].id if len(rows) == RANKING_WINDOW else 1
+
+    results = []
+    for row in rows:
+        highlighted = row.content or ''
+        if HIGHLIGHT_START not in highlighted and HIGHLIGHT_START in (row.translated_content or ''):
+            highlighted = row.translated_content
+        results.append({
+            'id': row.id,
+            'score': score(highlighted),
+            'snippet': make_snippet(highlighted),
+            'sender_id': row.sender_id,
+            'receiver_id': row.receiver_id,
+            'timestamp': row.timestamp,
+            'message_type': row.message_type
+        })
+    results.sort(key=lambda result: (-result['score'], -result['id']))
+    return results, top, bottom
+
+
+def search(connection, user_id, query, contact_id=None, limit=20, after=None):
+    """
+    Messages de user_id correspondant à query, par fenêtres de RANKING_WINDOW
+    correspondances des plus récentes aux plus anciennes ; dans chaque fenêtre,
+    du plus pertinent au moins pertinent (à égalité, le plus récent d'abord).
+    Les bornes de la fenêtre (ids) sont dans le curseur : les messages arrivés
+    entre deux pages ne décalent pas la pagination.
+    after : curseur (haut, bas, score, id) de la page précédente (voir decode_cursor).
+    Retourne (résultats, curseur suivant ou None) ; chaque résultat est un dict
+    avec id, score, snippet (marqué par HIGHLIGHT_START/END), sender_id,
+    receiver_id, timestamp et message_type.
+    """
+    expression = match_expression(query, user_id, contact_id)
+    if expression is None:
+        return [], None
+
+    top, bottom, after_score, after_id = after or (MAX_ID, None, None, None)
+    page = []
+    while top >= 1:
+        results, top, bottom = _ranked_window(connection, expression, top, bottom)
+        if not results:
+            return page, None
+        if after_id is not None:
+            results = [result for result in results
+                       if (-result['score'], -result['id']) > (-after_score, -after_id)]
+
+        room = limit - len(page)
+        page.extend(results[:room])
+        if len(results) > room:
+            return page, (top, bottom, page[-1]['score'], page[-1]['id'])
+
+        # Fenêtre épuisée : la suivante commence sous son bas
+        top, bottom, after_score, after_id = bottom - 1, None, None, None
+        if len(page) == limit:
+            more = top >= 1 and connection.execute(
+                text(SEARCH_BELOW), {'query': expression, 'top': top}
+            ).first() is not None
+            return page, (top, None, None, None) if more else None
+    return page, None
+
+
+if __name__ == '__main__':
+    from app import app, db
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            install(connection)
+            print(f"✅ Index de recherche reconstruit ({rebuild(connection)} messages)")
@@ -1,6 +1,8 @@
 # migrate_db.py
-from app import app, db
+from app import app, db, create_delivery_queue, create_missing_indexes, rebuild_conversations
 from sqlalchemy import text
+import message_search
+import user_search
 
 print("🚀 Début de la migration...")
 
@@ -49,7 +51,67 @@ with app.app_context():
     
     db.session.commit()
     
-    # 7. Vérification finale
+    # 7. Créer les index des requêtes fréquentes
+    try:
+        delivered = create_delivery_queue()
+        if delivered:
+            print(f"✅ {delivered} messages existants marqués distribués")
+        created = create_missing_indexes()
+        print("✅ Index créés:", created if created else "aucun (déjà présents)")
+        # Statistiques pour le planificateur : sans elles, l'index partiel des messages
+        # non distribués peut être ignoré au profit d'un index sur toute la table
+        db.session.execute(text('ANALYZE message'))
+        db.session.commit()
+    except Exception as e:
+        print("⚠️ Erreur lors de la création des index:", e)
+    
+    # 8. Reconstruire les résumés de conversation (filigranes de lecture, numéros d'ordre)
+    try:
+        db.create_all()
+        added = set()
+        for table, column, definition in (
+            ('conversation', 'last_read_low', 'INTEGER NOT NULL DEFAULT 0'),
+            ('conversation', 'last_read_high', 'INTEGER NOT NULL DEFAULT 0'),
+            ('conversation', 'last_seq', 'INTEGER NOT NULL DEFAULT 0'),
+            ('conversation', 'updated_at', 'DATETIME'),
+            ('message', 'seq', 'INTEGER')
+        ):
+            try:
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {definition}'))
+                added.add(column)
+                print(f"✅ Colonne '{column}' ajoutée avec succès")
+            except Exception:
+                db.session.rollback()
+        db.session.execute(text('DROP INDEX IF EXISTS ix_message_receiver_sender_read'))
+        # Redondants avec les index composites (sender_id, ...) et (receiver_id, sender_id)
+        db.session.execute(text('DROP INDEX IF EXISTS ix_message_sender'))
+        db.session.execute(text('DROP INDEX IF EXISTS ix_message_receiver'))
+        db.session.commit()
+        # Filigranes existants conservés ; déduits de is_read seulement quand les colonnes viennent d'être ajoutées
+        count = rebuild_conversations(backfill_watermarks='last_read_low' in added)
+        print(f"✅ {count} résumés de conversation reconstruits")
+    except Exception as e:
+        print("⚠️ Erreur lors de la reconstruction des conversations:", e)
+    
+    # 9. Index de recherche plein texte (FTS5) : créer puis reconstruire
+    try:
+        with db.engine.begin() as connection:
+            message_search.install(connection)
+            count = message_search.rebuild(connection)
+        print(f"✅ Index de recherche reconstruit ({count} messages)")
+    except Exception as e:
+        print("⚠️ Erreur lors de la reconstruction de l'index de recherche:", e)
+    
+    # 10. Index de recherche des utilisateurs : créer puis reconstruire
+    try:
+        with db.engine.begin() as connection:
+            user_search.install(connection)
+            count = user_search.rebuild(connection)
+        print(f"✅ Index des utilisateurs reconstruit ({count} utilisateurs)")
+    except Exception as e:
+        print("⚠️ Erreur lors de la reconstruction de l'index des utilisateurs:", e)
+    
+    # 11. Vérification finale
     print("\n🔍 Vérification des colonnes...")
     result = db.session.execute(text("PRAGMA table_info(user)")).fetchall()
     columns = [col[1] for col in result]
@@ -0,0 +1,116 @@
+"""
+Présence des utilisateurs, tenue en mémoire dans le processus
+
+Chaque socket connecté est compté par utilisateur : plusieurs onglets ne
+s'écrasent plus, l'utilisateur reste en ligne tant qu'il en reste un.
+Les changements (en ligne, dernière activité) sont reportés dans la table
+user par lots périodiques au lieu d'un commit par connexion/déconnexion.
+"""
+import threading
+import time
+from datetime import datetime
+
+
+class PresenceRegistry:
+    """Sockets par utilisateur et dernière activité, avec écriture différée"""
+
+    def __init__(self, flush_interval=30.0):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sockets = {}
+        self._last_seen = {}
+        self._dirty = set()
+        self.connects = 0
+        self.disconnects = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+
+    def connect(self, user_id, sid):
+        """Enregistre un socket ; retourne True si l'utilisateur vient de passer en ligne"""
+        with self._lock:
+            sockets = self._sockets.setdefault(user_id, set())
+            came_online = not sockets
+            sockets.add(sid)
+            self._last_seen[user_id] = datetime.utcnow()
+            self._dirty.add(user_id)
+            self.connects += 1
+        return came_online
+
+    def disconnect(self, user_id, sid):
+        """Retire un socket ; retourne True si c'était le dernier de l'utilisateur"""
+        with self._lock:
+            sockets = self._sockets.get(user_id, set())
+            sockets.discard(sid)
+            went_offline = not sockets
+            if went_offline:
+                self._sockets.pop(user_id, None)
+            self._last_seen[user_id] = datetime.utcnow()
+            self._dirty.add(user_id)
+            self.disconnects += 1
+        return went_offline
+
+    def seen(self, user_id):
+        """Note une activité de l'utilisateur (connexion, déconnexion du compte...)"""
+        with self._lock:
+            self._last_seen[user_id] = datetime.utcnow()
+            self._dirty.add(user_id)
+
+    def is_online(self, user_id):
+        return user_id in self._sockets
+
+    def last_seen(self, user_id, default=None):
+        return self._last_seen.get(user_id, default)
+
+    def online_user_ids(self):
+        with self._lock:
+            return set(self._sockets)
+
+    def pending_rows(self):
+        """Retire et retourne les changements à écrire : [{'id', 'is_online', 'last_seen'}]"""
+        with self._lock:
+            rows = [
+                {'id': user_id, 'is_online': user_id in self._sockets, 'last_seen': self._last_seen[user_id]}
+                for user_id in self._dirty
+            ]
+            self._dirty.clear()
+        return rows
+
+    def flush(self, write):
+        """Écrit les changements en attente avec write(rows) ; les remet en file en cas d'erreur"""
+        rows = self.pending_rows()
+        if not rows:
+            return 0
+        try:
+            write(rows)
+        except Exception as e:
+            with self._lock:
+                self._dirty.update(row['id'] for row in rows)
+            print(f"Erreur d'écriture de la présence: {e}")
+            return 0
+        self.flushes += 1
+        self.rows_flushed += len(rows)
+        return len(rows)
+
+    def start_flusher(self, write, spawn=None, sleep=time.sleep):
+        """Lance l'écriture périodique (spawn : lanceur de tâche de fond)"""
+        def run():
+            while True:
+                sleep(self.flush_interval)
+                self.flush(write)
+
+        if spawn is not None:
+            return spawn(run)
+        thread = threading.Thread(target=run, name='presence-flush', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {
+            'online_users': len(self._sockets),
+            'sockets': sum(len(sockets) for sockets in self._sockets.values()),
+            'pending': len(self._dirty),
+            'connects': self.connects,
+            'disconnects': self.disconnects,
+            'flushes': self.flushes,
+            'rows_flushed': self.rows_flushed
+        }
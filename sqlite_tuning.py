@@ -0,0 +1,162 @@
+"""
+Mode production SQLite (SQLITE_PRODUCTION=1)
+
+- journal WAL : les lecteurs ne bloquent plus l'écrivain et inversement
+- synchronous=NORMAL, busy_timeout, mmap_size et cache_size à chaque connexion
+- une seule connexion d'écriture (les écritures SQLite sont de toute façon
+  sérialisées) et un pool borné de connexions en lecture seule
+- point de contrôle (checkpoint) périodique du fichier WAL
+
+Les sessions lisent sur le pool de lecture tant qu'elles n'ont rien écrit ;
+dès la première écriture (flush, INSERT/UPDATE/DELETE, SQL brut) elles passent
+sur la connexion d'écriture jusqu'à la fin de la transaction, et voient donc
+leurs propres écritures.
+"""
+import sqlite3
+import threading
+import time
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+# Nom du bind Flask-SQLAlchemy des connexions en lecture seule
+READER_BIND = 'sqlite_reader'
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite:///') and ':memory:' not in uri
+
+
+def configure(app):
+    """Prépare la configuration des moteurs ; à appeler avant SQLAlchemy(app)"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not app.config.get('SQLITE_PRODUCTION') or not is_sqlite(uri):
+        return False
+
+    # Écrivain unique
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    engine_options.update(pool_size=1, max_overflow=0, pool_timeout=app.config['SQLITE_POOL_TIMEOUT'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    # Pool de lecteurs : pool_size connexions gardées, jusqu'à max_overflow de plus
+    # le temps d'un pic (fermées au retour). Sans monkey patching, un green thread
+    # qui attend une connexion bloque tout le hub eventlet, y compris ceux qui
+    # devraient la rendre : au-delà de la borne, l'attente se termine donc par
+    # une erreur après pool_timeout. La borne doit dépasser le nombre de requêtes
+    # simultanées qui gardent une connexion de lecture.
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[READER_BIND] = {
+        'url': uri,
+        'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+        'max_overflow': app.config['SQLITE_READ_MAX_OVERFLOW'],
+        'pool_timeout': app.config['SQLITE_POOL_TIMEOUT']
+    }
+    app.config['SQLALCHEMY_BINDS'] = binds
+    return True
+
+
+def tune_engine(engine, busy_timeout=5000, mmap_size=256 * 1024 * 1024, cache_size=-65536,
+                read_only=False):
+    """Applique les pragmas à chaque nouvelle connexion du moteur"""
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.execute(f'PRAGMA cache_size={int(cache_size)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        if read_only:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+    return engine
+
+
+def install(app, db):
+    """Branche les pragmas sur les moteurs créés ; à appeler après SQLAlchemy(app)"""
+    if READER_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return False
+
+    options = dict(
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+        mmap_size=app.config['SQLITE_MMAP_SIZE'],
+        cache_size=app.config['SQLITE_CACHE_SIZE']
+    )
+    with app.app_context():
+        writer = tune_engine(db.engines[None], **options)
+        tune_engine(db.engines[READER_BIND], read_only=True, **options)
+        # Passer la base en WAL avant que les lecteurs ne s'y connectent
+        with writer.connect():
+            pass
+    return True
+
+
+def checkpoint(database_path, mode='PASSIVE'):
+    """Reporte le fichier WAL dans la base ; retourne (occupé, pages du WAL, pages reportées)"""
+    connection = sqlite3.connect(database_path, timeout=5)
+    try:
+        return connection.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    finally:
+        connection.close()
+
+
+def start_checkpointer(app, spawn=None, sleep=time.sleep):
+    """Lance le point de contrôle périodique du WAL (spawn : lanceur de tâche de fond)"""
+    interval = app.config['SQLITE_CHECKPOINT_INTERVAL']
+    if READER_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}) or not interval:
+        return None
+
+    database_path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+
+    def run():
+        while True:
+            sleep(interval)
+            try:
+                checkpoint(database_path)
+            except sqlite3.Error as e:
+                print(f"Erreur de checkpoint WAL: {e}")
+
+    if spawn is not None:
+        return spawn(run)
+    thread = threading.Thread(target=run, name='sqlite-checkpoint', daemon=True)
+    thread.start()
+    return thread
+
+
+class RoutingSession(Session):
+    """Session qui lit sur le pool de lecture tant qu'elle n'a rien écrit"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writing = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or not isinstance(clause, Select):
+                self._writing = True
+            elif not self._writing:
+                reader = self._db.engines.get(READER_BIND)
+                if reader is not None:
+                    return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        super().commit()
+        self._writing = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._writing = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._writing = False
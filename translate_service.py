@@ -1,34 +1,269 @@
 import json
 import os
-from translatepy import Translator
-from translatepy.exceptions import TranslatepyException
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrency import SingleFlight
+from language_detection import LanguageDetector
+from translation_backends import BackendChain, BackendError, build_backends
+from translation_memory import FuzzyIndex, TranslationCache, TranslationMemory, apply_shape, text_shape
+
+# Frontière de phrase : espaces après une ponctuation finale, ou saut de ligne
+SEGMENT_BOUNDARY_RE = re.compile(r'((?<=[.!?…])\s+|\s*\n\s*)')
+
+def split_segments(text):
+    """Découpe un texte en phrases ; retourne (segments, séparateurs)"""
+    parts = SEGMENT_BOUNDARY_RE.split(text)
+    segments = parts[0::2]
+    separators = parts[1::2]
+    
+    # Un séparateur en tête ou en fin de texte laisse un segment vide
+    if segments and not segments[-1]:
+        segments.pop()
+        trailing = separators.pop()
+    else:
+        trailing = ''
+    if segments and not segments[0]:
+        segments.pop(0)
+        leading = separators.pop(0)
+    else:
+        leading = ''
+    return segments, separators, leading, trailing
+
+# Contenu à ne jamais traduire ni altérer
+URL_RE = re.compile(r'(?:https?://|www\.)[^\s<>"]*[^\s<>".,;:!?)\]»\']', re.IGNORECASE)
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+MENTION_RE = re.compile(r'(?<![\w.@])@\w+')
+INLINE_CODE_RE = re.compile(r'`[^`\n]+`')
+PHONE_RE = re.compile(r'\+?\d[\d\s().-]{5,}\d')
+NUMBER_RE = re.compile(r'[+-]?[\d\s.,:/%€$£-]*\d[\d\s.,:/%€$£-]*')
+CODE_BLOCK_RE = re.compile(r'```.*```', re.DOTALL)
+PLACEHOLDER_RE = re.compile(r'⟦\s*(\d+)\s*⟧')
+
+PROTECTED_PATTERNS = (URL_RE, EMAIL_RE, MENTION_RE, INLINE_CODE_RE)
+
+def classify_text(text):
+    """
+    Classe un texte avant traduction : 'url', 'email', 'mention', 'code',
+    'phone', 'number', 'symbols' (emoji, ponctuation) ou 'text'.
+    Seule la catégorie 'text' a besoin d'être traduite.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return 'symbols'
+    if CODE_BLOCK_RE.fullmatch(stripped) or INLINE_CODE_RE.fullmatch(stripped):
+        return 'code'
+    for category, pattern in (('url', URL_RE), ('email', EMAIL_RE), ('mention', MENTION_RE),
+                              ('phone', PHONE_RE), ('number', NUMBER_RE)):
+        if pattern.fullmatch(stripped):
+            return category
+    
+    remaining = stripped
+    for pattern in PROTECTED_PATTERNS:
+        remaining = pattern.sub(' ', remaining)
+    if not any(char.isalpha() for char in remaining):
+        return 'symbols'
+    return 'text'
+
+def protect_spans(text):
+    """Remplace liens, emails, mentions et code par des marqueurs ⟦n⟧"""
+    spans = []
+    
+    def replace(match):
+        spans.append(match.group(0))
+        return f'⟦{len(spans) - 1}⟧'
+    
+    for pattern in PROTECTED_PATTERNS:
+        text = pattern.sub(replace, text)
+    return text, spans
+
+def restore_spans(text, spans):
+    """Remet en place les éléments protégés après traduction"""
+    if not spans:
+        return text
+    
+    restored = set()
+    
+    def replace(match):
+        index = int(match.group(1))
+        if index >= len(spans):
+            return match.group(0)
+        restored.add(index)
+        return spans[index]
+    
+    text = PLACEHOLDER_RE.sub(replace, text)
+    
+    # Un marqueur perdu par le service externe est rajouté en fin de texte
+    missing = [spans[index] for index in range(len(spans)) if index not in restored]
+    if missing:
+        text = ' '.join([text.rstrip()] + missing)
+    return text
+
+def join_segments(segments, separators, leading='', trailing=''):
+    """Réassemble des segments traduits avec leurs séparateurs d'origine"""
+    pieces = [leading]
+    for index, segment in enumerate(segments):
+        pieces.append(segment)
+        if index < len(separators):
+            pieces.append(separators[index])
+    pieces.append(trailing)
+    return ''.join(pieces)
 
 class TranslationService:
-    def __init__(self):
-        self.translator = Translator()
-        self.custom_translations = {}
+    def __init__(self, backends='translatepy,deep-translator', timeout=5.0, hedge=False, batch_workers=4,
+                 fuzzy_threshold=None):
+        if isinstance(backends, str):
+            backends = build_backends(backends)
+        self.backends = BackendChain(backends, timeout=timeout, hedge=hedge)
+        self.batch_workers = batch_workers
+        self.cache = TranslationCache()
+        self.inflight = SingleFlight()
+        self.segment_stats = {'messages': 0, 'segments': 0, 'segment_hits': 0, 'backend_calls': 0}
+        self.tier_stats = {'skipped': 0, 'cache': 0, 'exact': 0, 'normalized': 0, 'fuzzy': 0, 'backend': 0}
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_indexes = {}
+        self._stats_lock = threading.Lock()
+        self.detector = LanguageDetector(backend=self._backend_detect_language)
         self.custom_translations_file = 'custom_translations.json'
+        self.memory = TranslationMemory()
         self.load_custom_translations()
     
     def load_custom_translations(self):
-        """Charge les traductions personnalisées"""
+        """Importe une seule fois l'ancien fichier JSON dans la mémoire de traduction"""
         try:
-            if os.path.exists(self.custom_translations_file):
-                with open(self.custom_translations_file, 'r', encoding='utf-8') as f:
-                    self.custom_translations = json.load(f)
-            else:
-                self.custom_translations = {}
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            imported = self.memory.import_json(self.custom_translations_file)
+            if imported:
+                print(f"{imported} traductions importées depuis {self.custom_translations_file}")
+        except (OSError, json.JSONDecodeError) as e:
             print(f"Erreur lors du chargement des traductions personnalisées: {e}")
-            self.custom_translations = {}
     
-    def save_custom_translations(self):
-        """Sauvegarde les traductions personnalisées"""
-        try:
-            with open(self.custom_translations_file, 'w', encoding='utf-8') as f:
-                json.dump(self.custom_translations, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde des traductions: {e}")
+    def _remember(self, from_lang, to_lang, text, translation):
+        """Enregistre une traduction en mémoire et dans le cache du processus"""
+        self.memory.put(from_lang, to_lang, text, translation)
+        self.cache.set((from_lang, to_lang, text), translation)
+        if (from_lang, to_lang) in self.fuzzy_indexes:
+            self.fuzzy_indexes[(from_lang, to_lang)].add(text, translation)
+    
+    def _lookup(self, from_lang, to_lang, text):
+        """Cherche une traduction dans le cache du processus puis dans la mémoire"""
+        key = (from_lang, to_lang, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count_tier('cache')
+            return cached
+        
+        translation = self.memory.get(from_lang, to_lang, text)
+        if translation is not None:
+            self._count_tier('exact')
+            self.cache.set(key, translation)
+            return translation
+        
+        return self._lookup_near(from_lang, to_lang, text)
+    
+    def _lookup_near(self, from_lang, to_lang, text):
+        """
+        Cherche une traduction pour un texte proche : même forme normalisée
+        (casse, espaces, ponctuation finale), puis, si activé, texte similaire
+        au-dessus de fuzzy_threshold. La casse et la ponctuation du texte
+        demandé sont réappliquées à la traduction trouvée.
+        """
+        match = self.memory.get_normalized(from_lang, to_lang, text)
+        tier = 'normalized'
+        
+        if match is None and self.fuzzy_threshold:
+            found = self._fuzzy_index(from_lang, to_lang).search(text)
+            if found:
+                match = found[:2]
+                tier = 'fuzzy'
+        
+        if match is None:
+            return None
+        
+        _, translation = match
+        translation = apply_shape(translation, text_shape(text))
+        self._count_tier(tier)
+        self.cache.set((from_lang, to_lang, text), translation)
+        return translation
+    
+    def _fuzzy_index(self, from_lang, to_lang):
+        """Index approché d'une paire de langues, construit à la première utilisation"""
+        pair = (from_lang, to_lang)
+        if pair not in self.fuzzy_indexes:
+            index = FuzzyIndex(threshold=self.fuzzy_threshold)
+            for source_text, translation in self.memory.iter_pair(from_lang, to_lang):
+                index.add(source_text, translation)
+            self.fuzzy_indexes[pair] = index
+        return self.fuzzy_indexes[pair]
+    
+    def _count_tier(self, tier, value=1):
+        """Compte les traductions servies par chaque niveau"""
+        with self._stats_lock:
+            self.tier_stats[tier] += value
+    
+    def _count(self, **increments):
+        """Incrémente les statistiques de segmentation"""
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.segment_stats[name] += value
+    
+    def _backend_translate(self, text, from_lang, to_lang):
+        """Traduit un texte absent de la mémoire et mémorise le résultat"""
+        # Les demandes identiques simultanées partagent un seul appel
+        return self.inflight.do(
+            (from_lang, to_lang, text),
+            lambda: self._translate_segments(text, from_lang, to_lang)
+        )
+    
+    def _translate_segments(self, text, from_lang, to_lang):
+        """
+        Traduit un texte phrase par phrase.
+        Chaque phrase déjà connue vient de la mémoire ; les autres partent
+        ensemble au service externe en un seul lot.
+        """
+        segments, separators, leading, trailing = split_segments(text)
+        
+        if len(segments) <= 1:
+            translation = self.backends.translate(text, from_lang, to_lang)
+            self._count(messages=1, segments=1, backend_calls=1)
+            self._count_tier('backend')
+            self._remember(from_lang, to_lang, text, translation)
+            return translation
+        
+        unique_segments = list(dict.fromkeys(segments))
+        translations = {}
+        for segment in unique_segments:
+            cached = self._lookup(from_lang, to_lang, segment)
+            if cached is not None:
+                translations[segment] = cached
+        
+        missing = [segment for segment in unique_segments if segment not in translations]
+        self._count(messages=1, segments=len(unique_segments), segment_hits=len(translations))
+        
+        if missing:
+            results = self.backends.translate_many(missing, from_lang, to_lang)
+            self._count(backend_calls=1)
+            self._count_tier('backend', len(missing))
+            if len(results) != len(missing):
+                # Lot incomplet : impossible d'apparier les phrases, traduire le texte entier
+                print(f"⚠️ Traduction par phrases: {len(results)} résultats pour {len(missing)} phrases, "
+                      f"texte traduit en entier")
+                translation = self.backends.translate(text, from_lang, to_lang)
+                self._count(backend_calls=1)
+                self._count_tier('backend')
+                self._remember(from_lang, to_lang, text, translation)
+                return translation
+            for segment, translation in zip(missing, results):
+                translations[segment] = translation
+                self.cache.set((from_lang, to_lang, segment), translation)
+                if (from_lang, to_lang) in self.fuzzy_indexes:
+                    self.fuzzy_indexes[(from_lang, to_lang)].add(segment, translation)
+            self.memory.put_many([
+                (from_lang, to_lang, segment, translations[segment]) for segment in missing
+            ])
+        
+        translation = join_segments([translations[segment] for segment in segments], separators, leading, trailing)
+        self._remember(from_lang, to_lang, text, translation)
+        return translation
     
     def translate_message(self, text, from_lang, to_lang):
         """
@@ -41,49 +276,114 @@ class TranslationService:
         if from_lang == to_lang:
             return text
         
+        # Emoji, liens, nombres, code... : rien à traduire
+        if classify_text(text) != 'text':
+            self._count_tier('skipped')
+            return text
+        
         try:
-            # Vérifier d'abord les traductions personnalisées
-            if (from_lang in self.custom_translations and 
-                to_lang in self.custom_translations[from_lang] and
-                text in self.custom_translations[from_lang][to_lang]):
-                return self.custom_translations[from_lang][to_lang][text]
-            
-            # Utiliser le service de traduction
-            result = self.translator.translate(text, destination_language=to_lang)
-            translation = str(result)
+            # Les liens, emails et mentions ne passent pas par la traduction
+            masked, spans = protect_spans(text)
             
-            # Stocker la traduction pour une utilisation future
-            if from_lang not in self.custom_translations:
-                self.custom_translations[from_lang] = {}
-            if to_lang not in self.custom_translations[from_lang]:
-                self.custom_translations[from_lang][to_lang] = {}
+            # Vérifier d'abord la mémoire de traduction
+            cached = self._lookup(from_lang, to_lang, masked)
+            if cached is not None:
+                return restore_spans(cached, spans)
             
-            self.custom_translations[from_lang][to_lang][text] = translation
-            self.save_custom_translations()
-            
-            return translation
+            # Utiliser le service de traduction
+            return restore_spans(self._backend_translate(masked, from_lang, to_lang), spans)
             
-        except TranslatepyException as e:
-            print(f"Erreur de traduction translatepy: {e}")
+        except BackendError as e:
+            print(f"Erreur de traduction: {e}")
             return text
         except Exception as e:
             print(f"Erreur générale de traduction: {e}")
             return text
     
-    def detect_language(self, text):
-        """Détecte la langue d'un texte"""
-        if not text or not isinstance(text, str):
-            return 'en'
-            
+    def translate_batch(self, texts, from_lang, to_lang):
+        """
+        Traduit une liste de textes en une seule passe.
+        Les doublons ne sont traduits qu'une fois, les textes connus viennent
+        de la mémoire et les autres partent au service externe en parallèle
+        (au plus batch_workers appels simultanés). L'ordre est conservé.
+        """
+        if from_lang == to_lang:
+            return list(texts)
+        
+        unique_texts = list(dict.fromkeys(t for t in texts if t and isinstance(t, str)))
+        results = {}
+        masked_texts = {}
+        for text in unique_texts:
+            if classify_text(text) == 'text':
+                masked_texts[text] = protect_spans(text)
+            else:
+                self._count_tier('skipped')
+                results[text] = text
+        
+        translations = {}
+        
+        # 1. Cache du processus
+        remaining = []
+        for masked in dict.fromkeys(masked for masked, _ in masked_texts.values()):
+            cached = self.cache.get((from_lang, to_lang, masked))
+            if cached is not None:
+                self._count_tier('cache')
+                translations[masked] = cached
+            else:
+                remaining.append(masked)
+        
+        # 2. Mémoire de traduction, en une requête
+        if remaining:
+            try:
+                found = self.memory.get_many(from_lang, to_lang, remaining)
+            except Exception as e:
+                print(f"Erreur de lecture de la mémoire de traduction: {e}")
+                found = {}
+            for masked, translation in found.items():
+                self.cache.set((from_lang, to_lang, masked), translation)
+            self._count_tier('exact', len(found))
+            translations.update(found)
+            remaining = [masked for masked in remaining if masked not in found]
+        
+        # 3. Textes proches (forme normalisée ou similaire)
+        for masked in list(remaining):
+            near = self._lookup_near(from_lang, to_lang, masked)
+            if near is not None:
+                translations[masked] = near
+                remaining.remove(masked)
+        
+        # 4. Service externe pour les textes manquants
+        def translate_one(masked):
+            try:
+                return self._backend_translate(masked, from_lang, to_lang)
+            except Exception as e:
+                print(f"Erreur de traduction par lot: {e}")
+                return masked
+        
+        if remaining:
+            with ThreadPoolExecutor(max_workers=min(self.batch_workers, len(remaining))) as executor:
+                translations.update(zip(remaining, executor.map(translate_one, remaining)))
+        
+        for text, (masked, spans) in masked_texts.items():
+            results[text] = restore_spans(translations.get(masked, masked), spans)
+        
+        return [results.get(text, text) if isinstance(text, str) else text for text in texts]
+    
+    def _backend_detect_language(self, text):
+        """Détecte la langue avec le service externe (appel réseau)"""
+        return self.backends.detect(text)
+    
+    def detect_language(self, text, default='en', allow_backend=True):
+        """
+        Détecte la langue d'un texte.
+        La détection est locale ; le service externe n'est consulté que si la
+        confiance est faible et que allow_backend est vrai.
+        """
         try:
-            result = self.translator.language(text)
-            return str(result.result.language) if hasattr(result, 'result') else 'en'
-        except TranslatepyException as e:
-            print(f"Erreur de détection de langue: {e}")
-            return 'en'
+            return self.detector.detect(text, default=default, allow_backend=allow_backend)
         except Exception as e:
             print(f"Erreur générale de détection: {e}")
-            return 'en'
+            return default
     
     def add_custom_translation(self, from_lang, to_lang, original, translation):
         """Ajoute une traduction personnalisée"""
@@ -91,13 +391,7 @@ class TranslationService:
             return False
             
         try:
-            if from_lang not in self.custom_translations:
-                self.custom_translations[from_lang] = {}
-            if to_lang not in self.custom_translations[from_lang]:
-                self.custom_translations[from_lang][to_lang] = {}
-            
-            self.custom_translations[from_lang][to_lang][original] = translation
-            self.save_custom_translations()
+            self._remember(from_lang, to_lang, original, translation)
             return True
         except Exception as e:
             print(f"Erreur lors de l'ajout de la traduction personnalisée: {e}")
@@ -190,8 +484,8 @@ class TranslationService:
     def clear_custom_translations(self):
         """Efface toutes les traductions personnalisées"""
         try:
-            self.custom_translations = {}
-            self.save_custom_translations()
+            self.cache.clear()
+            self.memory.clear()
             print("Traductions personnalisées effacées")
             return True
         except Exception as e:
@@ -200,30 +494,54 @@ class TranslationService:
     
     def get_translation_stats(self):
         """Retourne des statistiques sur les traductions"""
-        total_translations = 0
-        language_pairs = 0
-        
-        for from_lang in self.custom_translations:
-            for to_lang in self.custom_translations[from_lang]:
-                language_pairs += 1
-                total_translations += len(self.custom_translations[from_lang][to_lang])
+        stats = self.memory.stats()
         
         return {
-            'total_translations': total_translations,
-            'language_pairs': language_pairs,
-            'custom_translations': self.custom_translations
+            'total_translations': stats['total_translations'],
+            'language_pairs': stats['language_pairs'],
+            'cache': self.cache.stats(),
+            'inflight': self.inflight.stats(),
+            'detection': self.detector.stats(),
+            'backends': self.backends.stats(),
+            'segmentation': self._segmentation_stats(),
+            'tiers': self._tier_stats()
         }
+    
+    def _tier_stats(self):
+        """Part du trafic absorbée par chaque niveau (cache, mémoire, proche, service)"""
+        with self._stats_lock:
+            counts = dict(self.tier_stats)
+        total = sum(counts.values())
+        return {
+            tier: {'count': count, 'ratio': round(count / total, 4) if total else 0.0}
+            for tier, count in counts.items()
+        }
+    
+    def _segmentation_stats(self):
+        """Taux de réussite de la mémoire par phrase et appels externes par message"""
+        with self._stats_lock:
+            stats = dict(self.segment_stats)
+        stats['segment_hit_ratio'] = round(stats['segment_hits'] / stats['segments'], 4) if stats['segments'] else 0.0
+        stats['backend_calls_per_message'] = round(stats['backend_calls'] / stats['messages'], 4) if stats['messages'] else 0.0
+        return stats
 
 # Instance globale avec gestion d'erreur
 try:
-    translation_service = TranslationService()
+    from config import Config
+    translation_service = TranslationService(
+        backends=Config.TRANSLATION_BACKENDS,
+        timeout=Config.TRANSLATION_TIMEOUT,
+        hedge=Config.TRANSLATION_HEDGING,
+        fuzzy_threshold=Config.TRANSLATION_FUZZY_THRESHOLD
+    )
     print("Service de traduction initialisé avec succès")
 except Exception as e:
     print(f"Erreur lors de l'initialisation du service de traduction: {e}")
     # Créer une instance basique en cas d'erreur
     translation_service = type('TranslationServiceFallback', (), {
         'translate_message': lambda self, text, from_lang, to_lang: text,
-        'detect_language': lambda self, text: 'en',
+        'translate_batch': lambda self, texts, from_lang, to_lang: list(texts),
+        'detect_language': lambda self, text, default='en', allow_backend=True: default,
         'add_custom_translation': lambda self, *args: False,
         'get_supported_languages': lambda self: {'en': 'English', 'fr': 'Français'}
     })()
\ No newline at end of file
@@ -0,0 +1,341 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from translatepy import Translator
+except ImportError:
+    Translator = None
+
+try:
+    from deep_translator import GoogleTranslator
+except ImportError:
+    GoogleTranslator = None
+
+
+class BackendError(Exception):
+    """Aucun service de traduction n'a pu répondre"""
+
+
+class BackendTimeout(BackendError):
+    """Le délai de l'appel a expiré"""
+
+
+# =============== SERVICES DE TRADUCTION ===============
+
+class TranslationBackend:
+    """Interface commune des services de traduction"""
+    name = 'base'
+
+    def translate(self, text, from_lang, to_lang):
+        raise NotImplementedError
+
+    def translate_many(self, texts, from_lang, to_lang):
+        """Traduit plusieurs textes (un appel par texte par défaut)"""
+        return [self.translate(text, from_lang, to_lang) for text in texts]
+
+    def detect(self, text):
+        """Retourne le code de langue détecté, ou None si non supporté"""
+        return None
+
+
+class TranslatepyBackend(TranslationBackend):
+    """Service translatepy (agrège plusieurs traducteurs en ligne)"""
+    name = 'translatepy'
+
+    def __init__(self):
+        if Translator is None:
+            raise ImportError("translatepy n'est pas installé")
+        self.translator = Translator()
+
+    def translate(self, text, from_lang, to_lang):
+        return str(self.translator.translate(text, destination_language=to_lang))
+
+    def translate_many(self, texts, from_lang, to_lang):
+        """Traduit tous les textes en un seul appel, une ligne par texte"""
+        if len(texts) > 1 and not any('\n' in text for text in texts):
+            lines = self.translate('\n'.join(texts), from_lang, to_lang).split('\n')
+            if len(lines) == len(texts):
+                return [line.strip() for line in lines]
+        return super().translate_many(texts, from_lang, to_lang)
+
+    def detect(self, text):
+        result = self.translator.language(text)
+        return str(result.result.language) if hasattr(result, 'result') else None
+
+
+class DeepTranslatorBackend(TranslationBackend):
+    """Service Google Translate via deep-translator"""
+    name = 'deep-translator'
+
+    # Codes de l'application -> codes attendus par Google
+    LANGUAGE_ALIASES = {'zh': 'zh-CN'}
+
+    def __init__(self):
+        if GoogleTranslator is None:
+            raise ImportError("deep-translator n'est pas installé")
+
+    def _translator(self, from_lang, to_lang):
+        source = self.LANGUAGE_ALIASES.get(from_lang, from_lang) if from_lang else 'auto'
+        target = self.LANGUAGE_ALIASES.get(to_lang, to_lang)
+        return GoogleTranslator(source=source, target=target)
+
+    def translate(self, text, from_lang, to_lang):
+        return self._translator(from_lang, to_lang).translate(text)
+
+    def translate_many(self, texts, from_lang, to_lang):
+        return self._translator(from_lang, to_lang).translate_batch(list(texts))
+
+
+class StubBackend(TranslationBackend):
+    """Service local et déterministe, pour les tests hors ligne
+
+    ``latency`` simule un service lent et ``fail`` un service en panne.
+    """
+    name = 'stub'
+
+    def __init__(self, latency=0.0, fail=False, name=None):
+        self.latency = latency
+        self.fail = fail
+        if name:
+            self.name = name
+
+    def translate(self, text, from_lang, to_lang):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise BackendError(f"{self.name} indisponible")
+        return f"[{to_lang}] {text}"
+
+
+BACKENDS = {
+    'translatepy': TranslatepyBackend,
+    'deep-translator': DeepTranslatorBackend,
+    'stub': StubBackend,
+}
+
+
+def build_backends(names):
+    """Instancie les services à partir de leurs noms ('translatepy,deep-translator')"""
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+
+    backends = []
+    for name in names:
+        if name not in BACKENDS:
+            print(f"Service de traduction inconnu ignoré: {name}")
+            continue
+        try:
+            backends.append(BACKENDS[name]())
+        except ImportError as e:
+            print(f"Service de traduction {name} indisponible: {e}")
+    return backends
+
+
+# =============== FIABILITÉ ===============
+
+class CircuitBreaker:
+    """Disjoncteur : coupe un service après trop d'échecs consécutifs
+
+    Après ``failure_threshold`` échecs le circuit s'ouvre et le service
+    est ignoré pendant ``reset_timeout`` secondes ; un seul appel d'essai
+    est ensuite autorisé (semi-ouvert) avant de le refermer.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Indique si un appel peut être tenté"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class BackendMetrics:
+    """Compteurs et latences récentes d'un service"""
+
+    def __init__(self, window=200):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            else:
+                self.latencies.append(latency)
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def percentile(self, ratio):
+        """Latence (secondes) au percentile demandé, None sans mesure"""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * ratio))]
+
+    def stats(self):
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'hedged': self.hedged,
+            'latency_p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'latency_p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class BackendChain:
+    """Chaîne ordonnée de services avec délai, disjoncteurs et requêtes doublées
+
+    Le premier service disponible est appelé ; en cas d'erreur le suivant
+    prend le relais, dans la limite de ``timeout`` secondes au total.
+    Avec ``hedge=True``, si le service ne répond pas dans son p95 habituel
+    (ou ``hedge_delay`` faute de mesures), le suivant est lancé en parallèle
+    et la première réponse l'emporte.
+    """
+
+    def __init__(self, backends, timeout=5.0, hedge=False, hedge_delay=1.0,
+                 failure_threshold=5, reset_timeout=30.0, max_workers=16):
+        self.backends = list(backends)
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.breakers = {
+            backend.name: CircuitBreaker(failure_threshold, reset_timeout) for backend in self.backends
+        }
+        self.metrics = {backend.name: BackendMetrics() for backend in self.backends}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translation')
+
+    def translate(self, text, from_lang, to_lang, timeout=None):
+        return self._call('translate', (text, from_lang, to_lang), timeout)
+
+    def translate_many(self, texts, from_lang, to_lang, timeout=None):
+        return self._call('translate_many', (list(texts), from_lang, to_lang), timeout)
+
+    def detect(self, text, timeout=None):
+        return self._call('detect', (text,), timeout)
+
+    def _timed_call(self, backend, method, args):
+        """Exécute l'appel dans un thread et met à jour métriques et disjoncteur"""
+        started = time.monotonic()
+        try:
+            result = getattr(backend, method)(*args)
+        except Exception:
+            self.metrics[backend.name].record(time.monotonic() - started, error=True)
+            self.breakers[backend.name].record_failure()
+            raise
+        self.metrics[backend.name].record(time.monotonic() - started)
+        self.breakers[backend.name].record_success()
+        return result
+
+    def _hedge_delay(self, backend):
+        p95 = self.metrics[backend.name].percentile(0.95)
+        return p95 if p95 is not None and len(self.metrics[backend.name].latencies) >= 20 else self.hedge_delay
+
+    def _call(self, method, args, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        candidates = []
+        for backend in self.backends:
+            if self.breakers[backend.name].allow():
+                candidates.append(backend)
+            else:
+                self.metrics[backend.name].increment('rejected')
+
+        if not candidates:
+            raise BackendError("Tous les services de traduction sont indisponibles")
+
+        pending = {}
+        errors = []
+
+        def launch():
+            backend = candidates.pop(0)
+            future = self._executor.submit(self._timed_call, backend, method, args)
+            pending[future] = (backend, time.monotonic())
+            return backend
+
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            wait_for = remaining
+            if self.hedge and candidates:
+                newest_backend, launched_at = max(pending.values(), key=lambda item: item[1])
+                hedge_at = launched_at + self._hedge_delay(newest_backend)
+                wait_for = max(0.0, min(remaining, hedge_at - time.monotonic()))
+
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                backend, _ = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    result = future.result()
+                    if result is not None:
+                        return result
+                    errors.append(f"{backend.name}: aucun résultat")
+                else:
+                    errors.append(f"{backend.name}: {error}")
+
+            if not done and self.hedge and candidates and time.monotonic() < deadline:
+                # Le service tarde : lancer le suivant en parallèle
+                self.metrics[launch().name].increment('hedged')
+            elif not pending and candidates:
+                # Le service a échoué : passer au suivant
+                launch()
+
+        for backend, _ in pending.values():
+            self.metrics[backend.name].increment('timeouts')
+            self.breakers[backend.name].record_failure()
+
+        if pending:
+            raise BackendTimeout(f"Délai de traduction dépassé ({'; '.join(errors) or 'pas de réponse'})")
+        raise BackendError('; '.join(errors) or "Aucun service de traduction disponible")
+
+    def stats(self):
+        """Retourne métriques et état du disjoncteur de chaque service"""
+        return {
+            backend.name: dict(self.metrics[backend.name].stats(), circuit=self.breakers[backend.name].state)
+            for backend in self.backends
+        }
@@ -0,0 +1,448 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION_RE = re.compile(r'[\s.!?…,;:]+$')
+
+
+def normalize_text(text):
+    """Forme canonique d'un texte pour la recherche
+
+    Unicode NFC, minuscules (casefold), espaces réduits et ponctuation
+    finale retirée : « Merci ! », « merci » et « Merci » ont la même clé.
+    """
+    text = unicodedata.normalize('NFC', text)
+    text = _TRAILING_PUNCTUATION_RE.sub('', text.strip())
+    return _WHITESPACE_RE.sub(' ', text).casefold()
+
+
+def text_shape(text):
+    """Décrit la casse et la ponctuation finale d'un texte source"""
+    stripped = text.strip()
+    match = _TRAILING_PUNCTUATION_RE.search(stripped)
+    punctuation = match.group(0).replace(' ', '') if match else ''
+    letters = [char for char in stripped if char.isalpha()]
+
+    if not letters:
+        case = 'mixed'
+    elif all(char.isupper() for char in letters) and len(letters) > 1:
+        case = 'upper'
+    elif all(char.islower() for char in letters):
+        case = 'lower'
+    elif letters[0].isupper():
+        case = 'capitalized'
+    else:
+        case = 'mixed'
+    return case, punctuation
+
+
+def apply_shape(translation, shape):
+    """Applique la casse et la ponctuation d'un texte source à une traduction"""
+    case, punctuation = shape
+    translation = _TRAILING_PUNCTUATION_RE.sub('', translation.strip())
+
+    if case == 'upper':
+        translation = translation.upper()
+    elif case == 'lower' and translation:
+        # Seule l'initiale : les noms propres et sigles de la traduction gardent leur casse
+        translation = translation[0].lower() + translation[1:]
+    elif case == 'capitalized' and translation:
+        translation = translation[0].upper() + translation[1:]
+    return translation + punctuation
+
+
+class TranslationMemory:
+    """Mémoire de traduction persistante (SQLite indexé)
+
+    Chaque traduction est une ligne de la table ``translation_memory``
+    indexée par (from_lang, to_lang, text_hash) : un ajout coûte une seule
+    insertion, quelle que soit la taille de la mémoire. Le journal WAL et
+    le ``busy_timeout`` permettent à plusieurs processus de partager le
+    même fichier sans se marcher dessus.
+    """
+
+    def __init__(self, db_path=os.path.join('database', 'translations.db'), busy_timeout=5000):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._create_schema()
+
+    @staticmethod
+    def text_hash(text):
+        """Calcule la clé de hachage d'un texte source"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        """Retourne la connexion SQLite du thread courant"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        """Crée les tables si elles n'existent pas"""
+        connection = self._connect()
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS translation_memory (
+                from_lang TEXT NOT NULL,
+                to_lang TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (from_lang, to_lang, text_hash)
+            ) WITHOUT ROWID
+        ''')
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(translation_memory)')]
+        if 'normalized_hash' not in columns:
+            # Base créée avant la recherche normalisée : ajouter et remplir la colonne.
+            # BEGIN IMMEDIATE sérialise les processus qui démarrent en même temps :
+            # le second revérifie sous le verrou et trouve la colonne déjà ajoutée.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                columns = [row[1] for row in connection.execute('PRAGMA table_info(translation_memory)')]
+                if 'normalized_hash' not in columns:
+                    connection.execute('ALTER TABLE translation_memory ADD COLUMN normalized_hash TEXT')
+                    rows = connection.execute(
+                        'SELECT from_lang, to_lang, text_hash, source_text FROM translation_memory'
+                    ).fetchall()
+                    connection.executemany(
+                        'UPDATE translation_memory SET normalized_hash = ? '
+                        'WHERE from_lang = ? AND to_lang = ? AND text_hash = ?',
+                        [(self.text_hash(normalize_text(source)), from_lang, to_lang, text_hash)
+                         for from_lang, to_lang, text_hash, source in rows]
+                    )
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS ix_translation_memory_normalized '
+            'ON translation_memory (from_lang, to_lang, normalized_hash)'
+        )
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS translation_memory_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+    def get(self, from_lang, to_lang, text):
+        """Retourne la traduction mémorisée ou None"""
+        row = self._connect().execute(
+            'SELECT source_text, translation FROM translation_memory '
+            'WHERE from_lang = ? AND to_lang = ? AND text_hash = ?',
+            (from_lang, to_lang, self.text_hash(text))
+        ).fetchone()
+
+        # Protection contre les collisions de hachage
+        if row and row[0] == text:
+            return row[1]
+        return None
+
+    def get_many(self, from_lang, to_lang, texts, chunk_size=500):
+        """Retourne un dictionnaire {texte: traduction} pour les textes mémorisés"""
+        by_hash = {self.text_hash(text): text for text in texts}
+        hashes = list(by_hash)
+        found = {}
+
+        connection = self._connect()
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = connection.execute(
+                'SELECT text_hash, source_text, translation FROM translation_memory '
+                f'WHERE from_lang = ? AND to_lang = ? AND text_hash IN ({placeholders})',
+                (from_lang, to_lang, *chunk)
+            ).fetchall()
+            for text_hash, source_text, translation in rows:
+                if by_hash[text_hash] == source_text:
+                    found[source_text] = translation
+        return found
+
+    def get_normalized(self, from_lang, to_lang, text):
+        """Retourne (texte source, traduction) d'une entrée de même forme normalisée, ou None"""
+        normalized = normalize_text(text)
+        rows = self._connect().execute(
+            'SELECT source_text, translation FROM translation_memory '
+            'WHERE from_lang = ? AND to_lang = ? AND normalized_hash = ? LIMIT 5',
+            (from_lang, to_lang, self.text_hash(normalized))
+        ).fetchall()
+        for source_text, translation in rows:
+            if normalize_text(source_text) == normalized:
+                return source_text, translation
+        return None
+
+    def iter_pair(self, from_lang, to_lang, max_length=200):
+        """Parcourt les entrées courtes d'une paire de langues (pour l'index approché)"""
+        return self._connect().execute(
+            'SELECT source_text, translation FROM translation_memory '
+            'WHERE from_lang = ? AND to_lang = ? AND length(source_text) <= ?',
+            (from_lang, to_lang, max_length)
+        )
+
+    def put(self, from_lang, to_lang, text, translation):
+        """Ajoute ou remplace une traduction"""
+        self.put_many([(from_lang, to_lang, text, translation)])
+
+    def put_many(self, entries, replace=True):
+        """Ajoute plusieurs traductions (from_lang, to_lang, texte, traduction) en une transaction"""
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        now = datetime.utcnow().isoformat()
+        rows = [
+            (from_lang, to_lang, self.text_hash(text), self.text_hash(normalize_text(text)), text, translation, now)
+            for from_lang, to_lang, text, translation in entries
+        ]
+
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.executemany(
+                f'{verb} INTO translation_memory '
+                '(from_lang, to_lang, text_hash, normalized_hash, source_text, translation, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return cursor.rowcount
+
+    def clear(self):
+        """Efface toute la mémoire de traduction"""
+        self._connect().execute('DELETE FROM translation_memory')
+
+    def stats(self):
+        """Retourne le nombre de traductions et de paires de langues"""
+        connection = self._connect()
+        total = connection.execute('SELECT COUNT(*) FROM translation_memory').fetchone()[0]
+        pairs = connection.execute(
+            'SELECT COUNT(*) FROM (SELECT DISTINCT from_lang, to_lang FROM translation_memory)'
+        ).fetchone()[0]
+        return {'total_translations': total, 'language_pairs': pairs}
+
+    def import_json(self, json_path):
+        """Importe une seule fois un ancien fichier custom_translations.json
+
+        Retourne le nombre de traductions importées (0 si le fichier a déjà
+        été importé ou n'existe pas).
+        """
+        if not os.path.exists(json_path):
+            return 0
+
+        meta_key = f'json_imported:{os.path.abspath(json_path)}'
+        connection = self._connect()
+        if connection.execute('SELECT 1 FROM translation_memory_meta WHERE key = ?', (meta_key,)).fetchone():
+            return 0
+
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        entries = [
+            (from_lang, to_lang, original, translation)
+            for from_lang, targets in data.items()
+            for to_lang, translations in targets.items()
+            for original, translation in translations.items()
+        ]
+
+        # Les traductions déjà présentes en base sont plus récentes que le fichier
+        imported = self.put_many(entries, replace=False) if entries else 0
+        connection.execute(
+            'INSERT OR REPLACE INTO translation_memory_meta (key, value) VALUES (?, ?)',
+            (meta_key, datetime.utcnow().isoformat())
+        )
+        return imported
+
+
+class TranslationCache:
+    """Cache LRU borné placé devant la mémoire de traduction
+
+    La taille est limitée à la fois en nombre d'entrées et en octets
+    (mesurés avec ``sys.getsizeof``). Une durée de vie optionnelle
+    (``ttl`` en secondes) fait expirer les entrées trop anciennes.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _entry_size(key, value):
+        """Estime l'occupation mémoire d'une entrée"""
+        parts = key if isinstance(key, tuple) else (key,)
+        return sum(sys.getsizeof(part) for part in parts) + sys.getsizeof(value)
+
+    def get(self, key):
+        """Retourne la valeur associée à la clé ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Ajoute une entrée et évince les moins récemment utilisées si besoin"""
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+
+            self._entries[key] = (value, size, expires_at)
+            self.bytes += size
+
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Vide le cache sans remettre les compteurs à zéro"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Retourne les compteurs du cache"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class FuzzyIndex:
+    """Index approché (trigrammes) sur les textes sources d'une paire de langues
+
+    Les candidats partageant le plus de trigrammes avec le texte cherché
+    sont vérifiés avec difflib ; seule une correspondance au-dessus de
+    ``threshold`` est retournée.
+    """
+
+    def __init__(self, threshold=0.9, max_entries=50000, max_length=200):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self._entries = []
+        self._seen = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def trigrams(normalized):
+        padded = f'  {normalized} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, source_text, translation):
+        """Ajoute (ou met à jour) une entrée"""
+        if len(source_text) > self.max_length:
+            return
+        normalized = normalize_text(source_text)
+        if not normalized:
+            return
+
+        with self._lock:
+            index = self._seen.get(normalized)
+            if index is not None:
+                self._entries[index] = (normalized, source_text, translation)
+                return
+            if len(self._entries) >= self.max_entries:
+                return
+
+            index = len(self._entries)
+            self._entries.append((normalized, source_text, translation))
+            self._seen[normalized] = index
+            for gram in self.trigrams(normalized):
+                self._postings[gram].add(index)
+
+    def search(self, text, candidates=5):
+        """Retourne (texte source, traduction, score) de la meilleure entrée proche, ou None"""
+        normalized = normalize_text(text)
+        grams = self.trigrams(normalized)
+        if not grams:
+            return None
+
+        with self._lock:
+            overlap = defaultdict(int)
+            for gram in grams:
+                for index in self._postings.get(gram, ()):
+                    overlap[index] += 1
+
+            # Filtre de Dice sur les trigrammes avant la comparaison exacte
+            best = sorted(overlap.items(), key=lambda item: item[1], reverse=True)[:candidates]
+            entries = [self._entries[index] for index, count in best
+                       if 2 * count / (len(grams) + len(self.trigrams(self._entries[index][0]))) >= self.threshold - 0.2]
+
+        match = None
+        for candidate, source_text, translation in entries:
+            score = difflib.SequenceMatcher(None, normalized, candidate).ratio()
+            if score >= self.threshold and (match is None or score > match[2]):
+                match = (source_text, translation, score)
+        return match
+
+    def __len__(self):
+        return len(self._entries)
+
+
+if __name__ == '__main__':
+    json_file = sys.argv[1] if len(sys.argv) > 1 else 'custom_translations.json'
+    memory = TranslationMemory()
+    print(f"🚀 Import de {json_file} dans {memory.db_path}...")
+    count = memory.import_json(json_file)
+    print(f"✅ {count} traduction(s) importée(s)")
+    print(f"📋 Statistiques: {memory.stats()}")
@@ -0,0 +1,165 @@
+"""
+Recherche d'utilisateurs (remplace les ilike '%q%' qui parcouraient la table user)
+
+La table user_search (modèle UserSearch dans app.py) garde, par utilisateur,
+le nom, la partie locale et le domaine de l'email normalisés : minuscules,
+sans accents.
+- préfixe : index B-tree sur le nom et la partie locale (dès 2 caractères)
+- sous-chaîne : index FTS5 trigramme user_search_fts (dès 3 caractères),
+  tenu à jour par des triggers sur user_search
+- saisie contenant '@' : adresse (partie locale exacte, début du domaine)
+  ou domaine seul ('@corp.io'), par l'index de chaque colonne
+Les contacts de l'utilisateur qui cherche passent en premier.
+"""
+import unicodedata
+
+from sqlalchemy import bindparam, text
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search_fts USING fts5(
+        name, email_local, content='user_search', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_fts_insert AFTER INSERT ON user_search BEGIN
+        INSERT INTO user_search_fts (rowid, name, email_local) VALUES (new.id, new.name, new.email_local);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_fts_delete AFTER DELETE ON user_search BEGIN
+        INSERT INTO user_search_fts (user_search_fts, rowid, name, email_local)
+        VALUES ('delete', old.id, old.name, old.email_local);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_fts_update AFTER UPDATE ON user_search BEGIN
+        INSERT INTO user_search_fts (user_search_fts, rowid, name, email_local)
+        VALUES ('delete', old.id, old.name, old.email_local);
+        INSERT INTO user_search_fts (rowid, name, email_local) VALUES (new.id, new.name, new.email_local);
+    END""",
+]
+
+CONTACTS = text("""
+    SELECT id, name, email_local FROM user_search
+    WHERE id IN :ids AND (instr(name, :q) > 0 OR instr(email_local, :q) > 0)
+""").bindparams(bindparam('ids', expanding=True))
+
+PREFIX = """
+    SELECT id, name, email_local FROM user_search
+    WHERE {column} >= :low AND {column} < :high
+    ORDER BY {column}
+    LIMIT :limit
+"""
+
+# Adresse : partie locale exacte, domaine commençant par la saisie
+ADDRESS = text("""
+    SELECT id, name, email_local FROM user_search
+    WHERE email_local = :local AND email_domain >= :low AND email_domain < :high
+    LIMIT :limit
+""")
+
+SUBSTRING = text("""
+    SELECT rowid AS id, name, email_local FROM user_search_fts
+    WHERE user_search_fts MATCH :match
+    LIMIT :limit
+""")
+
+
+def normalize(value):
+    """Minuscules et sans accents : 'Éloïse' -> 'eloise'"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def prefix_bounds(value):
+    """Intervalle [low, high[ des chaînes commençant par value (toutes si value est vide)"""
+    if not value:
+        return '', chr(0x10FFFF)
+    return value, value[:-1] + chr(ord(value[-1]) + 1)
+
+
+def search_row(user_id, username, email):
+    """Ligne de user_search d'un utilisateur"""
+    local, _, domain = (email or '').partition('@')
+    return {
+        'id': user_id,
+        'name': normalize(username),
+        'email_local': normalize(local),
+        'email_domain': normalize(domain)
+    }
+
+
+def install(connection):
+    """
+    Crée l'index trigramme et ses triggers s'ils manquent, et la colonne
+    email_domain d'une table user_search plus ancienne ; retourne True si
+    user_search doit être reconstruite.
+    """
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search_fts'")
+    ).first() is not None
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+
+    columns = {row[1] for row in connection.execute(text('PRAGMA table_info(user_search)'))}
+    if 'email_domain' not in columns:
+        connection.execute(text("ALTER TABLE user_search ADD COLUMN email_domain VARCHAR(120) NOT NULL DEFAULT ''"))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_user_search_email_domain ON user_search (email_domain)'))
+        return True
+    return not exists
+
+
+def rebuild(connection):
+    """Recalcule user_search depuis la table user, puis l'index trigramme"""
+    rows = [search_row(*row) for row in connection.execute(text('SELECT id, username, email FROM user'))]
+    connection.execute(text('DELETE FROM user_search'))
+    if rows:
+        connection.execute(text('INSERT INTO user_search (id, name, email_local, email_domain) '
+                                'VALUES (:id, :name, :email_local, :email_domain)'), rows)
+    connection.execute(text("INSERT INTO user_search_fts (user_search_fts) VALUES ('rebuild')"))
+    return len(rows)
+
+
+def search(connection, query, exclude_id=None, contact_ids=(), limit=20):
+    """
+    Identifiants des utilisateurs correspondant à query, classés : contacts,
+    puis nom commençant par la saisie, puis email commençant par la saisie,
+    puis le reste ; à égalité, les noms les plus courts d'abord.
+    Une saisie contenant '@' est cherchée comme une adresse ('jean@corp',
+    'jean@') ou un domaine ('@corp.io').
+    """
+    q = normalize(query).strip()
+    if len(q) < 2:
+        return []
+
+    candidates = {}
+    if '@' in q:
+        # Adresse ou domaine : classés ensuite sur la partie locale saisie
+        q, _, domain = q.partition('@')
+        low, high = prefix_bounds(domain)
+        if q:
+            rows = connection.execute(ADDRESS, {'local': q, 'low': low, 'high': high, 'limit': limit + 1})
+        else:
+            rows = connection.execute(text(PREFIX.format(column='email_domain')),
+                                      {'low': low, 'high': high, 'limit': limit + 1})
+        for row in rows:
+            candidates[row.id] = row
+    else:
+        if contact_ids:
+            for row in connection.execute(CONTACTS, {'ids': list(contact_ids), 'q': q}):
+                candidates[row.id] = row
+
+        low, high = prefix_bounds(q)
+        for column in ('name', 'email_local'):
+            for row in connection.execute(text(PREFIX.format(column=column)),
+                                          {'low': low, 'high': high, 'limit': limit + 1}):
+                candidates.setdefault(row.id, row)
+
+        if len(q) >= 3 and len(candidates) <= limit:
+            match = '{name email_local} : "' + q.replace('"', '""') + '"'
+            for row in connection.execute(SUBSTRING, {'match': match, 'limit': limit + 1}):
+                candidates.setdefault(row.id, row)
+
+    candidates.pop(exclude_id, None)
+    ranked = sorted(candidates.values(), key=lambda row: (
+        row.id not in contact_ids,
+        not row.name.startswith(q),
+        not row.email_local.startswith(q),
+        len(row.name),
+        row.name
+    ))
+    return [row.id for row in ranked[:limit]]
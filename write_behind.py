@@ -0,0 +1,171 @@
+"""
+Écriture groupée (group commit) des insertions de messages
+
+Les insertions envoyées par des requêtes concurrentes sont rassemblées
+pendant une courte fenêtre (``window_ms``, ou dès ``max_rows`` lignes) puis
+enregistrées dans une seule transaction : un seul fsync pour tout le lot.
+Chaque requête récupère ensuite les valeurs de sa ligne (id, horodatage...).
+
+Durabilité (``durability``) :
+
+- ``'commit'`` (par défaut) : la requête ne reprend la main qu'une fois le
+  lot validé. Un message annoncé comme envoyé est enregistré, avec les mêmes
+  garanties qu'un commit classique (avec synchronous=NORMAL en WAL, voir
+  sqlite_tuning.py, les derniers commits peuvent être perdus en cas de
+  coupure de courant, mais pas en cas d'arrêt de l'application).
+- ``'flush'`` : la requête reprend la main dès que son id est attribué,
+  avant le commit. Latence minimale, mais si le processus s'arrête
+  entre-temps, des messages déjà annoncés sont perdus.
+
+En cas d'échec du lot, chaque ligne est réessayée dans sa propre
+transaction pour qu'une ligne invalide ne fasse pas échouer les autres.
+En mode 'flush', les lignes déjà annoncées sont réessayées avec l'id
+annoncé ; elles ne sont perdues (et comptées dans ``failures``) que si ce
+nouvel essai échoue aussi.
+"""
+import queue
+import threading
+import time
+
+from sqlalchemy import inspect
+
+from concurrency import wait_event
+
+
+class _PendingWrite:
+    """Ligne en attente d'écriture et son résultat"""
+
+    def __init__(self, values):
+        self.values = values
+        self.done = threading.Event()
+        self.row = None
+        self.error = None
+
+
+class GroupCommitWriter:
+    """File d'écriture groupée pour un modèle SQLAlchemy
+
+    ``after_flush(obj)`` est appelé pour chaque objet après le flush du lot,
+    dans la même transaction (mise à jour des tables dérivées).
+    """
+
+    DURABILITY_MODES = ('commit', 'flush')
+
+    def __init__(self, app, db, model, after_flush=None, window_ms=2.0, max_rows=64,
+                 durability='commit', timeout=10.0):
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Mode de durabilité inconnu: {durability}")
+        self.app = app
+        self.db = db
+        self.model = model
+        self.after_flush = after_flush
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self.durability = durability
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.failures = 0
+
+    def submit(self, obj):
+        """Met l'objet en file, attend son écriture et y recopie les valeurs enregistrées"""
+        pending = _PendingWrite(dict(inspect(obj).dict))
+        pending.values.pop('_sa_instance_state', None)
+        self._ensure_started()
+        self._queue.put(pending)
+
+        if not wait_event(pending.done, self.timeout):
+            raise TimeoutError("Écriture groupée: délai dépassé")
+        if pending.error is not None:
+            raise pending.error
+
+        for key, value in pending.row.items():
+            setattr(obj, key, value)
+        return obj
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Attend une première ligne puis rassemble le lot (fenêtre ou taille max)"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.db.session.rollback()
+                    print(f"Écriture groupée: échec du lot de {len(batch)} lignes ({e}), nouvel essai ligne par ligne")
+                    for pending in batch:
+                        try:
+                            self._write([pending])
+                        except Exception as row_error:
+                            self.db.session.rollback()
+                            self.failures += 1
+                            if pending.done.is_set():
+                                # Mode 'flush' : ligne déjà annoncée à la requête, perdue
+                                print(f"Écriture groupée: ligne {pending.row.get('id')} annoncée puis perdue "
+                                      f"({row_error})")
+                            else:
+                                pending.error = row_error
+                                pending.done.set()
+                finally:
+                    self.db.session.remove()
+
+    def _write(self, batch):
+        session = self.db.session
+        # Ligne déjà annoncée (mode 'flush', nouvel essai) : réécrite telle qu'annoncée, id compris
+        objects = [self.model(**(pending.row if pending.done.is_set() else pending.values)) for pending in batch]
+        session.add_all(objects)
+        session.flush()
+        if self.after_flush is not None:
+            for obj in objects:
+                self.after_flush(obj)
+
+        columns = [attr.key for attr in inspect(self.model).column_attrs]
+        for pending, obj in zip(batch, objects):
+            pending.row = {key: getattr(obj, key) for key in columns}
+
+        if self.durability == 'flush':
+            for pending in batch:
+                pending.done.set()
+        session.commit()
+        if self.durability == 'commit':
+            for pending in batch:
+                pending.done.set()
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        """Retourne le nombre de lots, de lignes et la taille moyenne des lots"""
+        return {
+            'durability': self.durability,
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'rows': self.rows,
+            'average_batch': round(self.rows / self.batches, 1) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'failures': self.failures
+        }